@@ -0,0 +1,55 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+from app.config import settings
+from app.models import Base
+
+# Configuración de Alembic
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Metadatos de los modelos (para --autogenerate)
+target_metadata = Base.metadata
+
+def run_migrations_offline():
+    """Generar el SQL de las migraciones sin conectar a la base de datos"""
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+# Índices que solo existen en MySQL (ignorados por --autogenerate en otros motores)
+MYSQL_ONLY_INDEXES = {"ix_agents_fulltext"}
+
+def run_migrations_online():
+    """Aplicar las migraciones sobre DATABASE_URL"""
+    connectable = create_engine(settings.DATABASE_URL)
+
+    with connectable.connect() as connection:
+        def include_object(object, name, type_, reflected, compare_to):
+            if type_ == "index" and name in MYSQL_ONLY_INDEXES:
+                return connection.dialect.name == "mysql"
+            return True
+
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,39 @@
+"""Esquema inicial (tabla agents, creada hasta ahora con create_all)
+
+Las bases de datos creadas con la versión anterior de scripts/init_db.py ya
+tienen esta tabla: marcarlas con `alembic stamp 0001` antes de actualizar.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "agents",
+        sa.Column("id", sa.String(255), primary_key=True),
+        sa.Column("object_type", sa.String(50)),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text, nullable=True),
+        sa.Column("model", sa.String(100), nullable=False),
+        sa.Column("instructions", sa.Text, nullable=False),
+        sa.Column("tools", sa.JSON),
+        sa.Column("top_p", sa.Float),
+        sa.Column("temperature", sa.Float),
+        sa.Column("tool_resources", sa.JSON),
+        sa.Column("agent_metadata", sa.JSON),
+        sa.Column("response_format", sa.String(50)),
+        sa.Column("updated_at", sa.DateTime),
+    )
+
+def downgrade():
+    op.drop_table("agents")
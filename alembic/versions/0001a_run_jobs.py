@@ -0,0 +1,39 @@
+"""Cola persistente de runs
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0001a"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "run_jobs",
+        sa.Column("id", sa.String(64), primary_key=True),
+        sa.Column("thread_id", sa.String(255), nullable=False),
+        sa.Column("agent_id", sa.String(255), nullable=False),
+        sa.Column("message_id", sa.String(255), nullable=True),
+        sa.Column("prompt", sa.Text, nullable=True),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("run_id", sa.String(255), nullable=True),
+        sa.Column("next_thread_id", sa.String(255), nullable=True),
+        sa.Column("last_error", sa.Text, nullable=True),
+        sa.Column("result", sa.JSON, nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("started_at", sa.DateTime, nullable=True),
+        sa.Column("completed_at", sa.DateTime, nullable=True),
+    )
+    op.create_index("ix_run_jobs_status", "run_jobs", ["status"])
+    op.create_index("ix_run_jobs_created_at", "run_jobs", ["created_at"])
+
+def downgrade():
+    op.drop_index("ix_run_jobs_created_at", table_name="run_jobs")
+    op.drop_index("ix_run_jobs_status", table_name="run_jobs")
+    op.drop_table("run_jobs")
@@ -0,0 +1,43 @@
+"""Políticas por agente y enlaces entre threads resumidos
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0001b"
+down_revision = "0001a"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "agent_policies",
+        sa.Column("agent_id", sa.String(255), primary_key=True),
+        sa.Column("context_max_messages", sa.Integer, nullable=True),
+        sa.Column("context_max_tokens", sa.Integer, nullable=True),
+        sa.Column("context_keep_last", sa.Integer),
+        sa.Column("cache_enabled", sa.Boolean),
+        sa.Column("cache_ttl_seconds", sa.Integer),
+        sa.Column("cache_similarity_threshold", sa.Float, nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime),
+    )
+
+    op.create_table(
+        "thread_links",
+        sa.Column("old_thread_id", sa.String(255), primary_key=True),
+        sa.Column("new_thread_id", sa.String(255), nullable=False),
+        sa.Column("agent_id", sa.String(255), nullable=False),
+        sa.Column("summarized_messages", sa.Integer),
+        sa.Column("created_at", sa.DateTime),
+    )
+    op.create_index("ix_thread_links_new_thread_id", "thread_links", ["new_thread_id"])
+
+def downgrade():
+    op.drop_index("ix_thread_links_new_thread_id", table_name="thread_links")
+    op.drop_table("thread_links")
+    op.drop_table("agent_policies")
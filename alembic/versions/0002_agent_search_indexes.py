@@ -0,0 +1,38 @@
+"""Índices para la búsqueda de agentes
+
+Índices B-tree sobre name, model y created_at (filtros y ordenación de
+GET /agents/search) y, en MySQL, un índice FULLTEXT sobre
+name/description/instructions para la búsqueda por texto.
+
+Revision ID: 0002
+Revises: 0001b
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+# Identificadores de revisión usados por Alembic
+revision = "0002"
+down_revision = "0001b"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_agents_name", "agents", ["name"])
+    op.create_index("ix_agents_model", "agents", ["model"])
+    op.create_index("ix_agents_created_at", "agents", ["created_at"])
+
+    if op.get_bind().dialect.name == "mysql":
+        op.create_index(
+            "ix_agents_fulltext",
+            "agents",
+            ["name", "description", "instructions"],
+            mysql_prefix="FULLTEXT"
+        )
+
+def downgrade():
+    if op.get_bind().dialect.name == "mysql":
+        op.drop_index("ix_agents_fulltext", table_name="agents")
+
+    op.drop_index("ix_agents_created_at", table_name="agents")
+    op.drop_index("ix_agents_model", table_name="agents")
+    op.drop_index("ix_agents_name", table_name="agents")
@@ -0,0 +1,31 @@
+"""Endpoint propietario de cada recurso
+
+Tabla resource_endpoints: relaciona agentes, threads, archivos y vector stores
+con el endpoint de Azure Foundry (AZURE_AI_ENDPOINTS) en el que se crearon.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "resource_endpoints",
+        sa.Column("resource_id", sa.String(255), primary_key=True),
+        sa.Column("resource_type", sa.String(20), nullable=False),
+        sa.Column("endpoint", sa.String(100), nullable=False),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_resource_endpoints_endpoint", "resource_endpoints", ["endpoint"])
+
+def downgrade():
+    op.drop_index("ix_resource_endpoints_endpoint", table_name="resource_endpoints")
+    op.drop_table("resource_endpoints")
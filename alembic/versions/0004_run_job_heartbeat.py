@@ -0,0 +1,27 @@
+"""Heartbeat de los jobs de la cola de runs
+
+Columna heartbeat_at en run_jobs: los workers la renuevan mientras procesan un
+job y los que quedan en in_progress sin renovarla (proceso caído, parada
+interrumpida) vuelven a la cola. Índice (thread_id, status) para comprobar si
+un thread tiene un run pendiente o en curso.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("run_jobs", sa.Column("heartbeat_at", sa.DateTime, nullable=True))
+    op.create_index("ix_run_jobs_thread_id_status", "run_jobs", ["thread_id", "status"])
+
+def downgrade():
+    op.drop_index("ix_run_jobs_thread_id_status", table_name="run_jobs")
+    op.drop_column("run_jobs", "heartbeat_at")
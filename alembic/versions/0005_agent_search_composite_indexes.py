@@ -0,0 +1,29 @@
+"""Índices compuestos para la búsqueda de agentes
+
+GET /agents/search filtra por model o por prefijo de name y ordena por
+created_at: los índices (model, created_at) y (name, created_at) cubren filtro
+y orden. Sustituyen a los índices simples de name y model, que son su prefijo.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+# Identificadores de revisión usados por Alembic
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_agents_model_created_at", "agents", ["model", "created_at"])
+    op.create_index("ix_agents_name_created_at", "agents", ["name", "created_at"])
+    op.drop_index("ix_agents_model", table_name="agents")
+    op.drop_index("ix_agents_name", table_name="agents")
+
+def downgrade():
+    op.create_index("ix_agents_name", "agents", ["name"])
+    op.create_index("ix_agents_model", "agents", ["model"])
+    op.drop_index("ix_agents_name_created_at", table_name="agents")
+    op.drop_index("ix_agents_model_created_at", table_name="agents")
@@ -0,0 +1,33 @@
+"""Eventos de thread compartidos entre procesos
+
+Tabla thread_events: con varios workers cada proceso escribe en ella los
+eventos que publica (estados de runs, mensajes nuevos) y lee los de los demás
+para entregarlos a sus conexiones WebSocket.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Identificadores de revisión usados por Alembic
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "thread_events",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("thread_id", sa.String(255), nullable=False),
+        sa.Column("origin", sa.String(32), nullable=False),
+        sa.Column("payload", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+    )
+    op.create_index("ix_thread_events_created_at", "thread_events", ["created_at"])
+
+def downgrade():
+    op.drop_index("ix_thread_events_created_at", table_name="thread_events")
+    op.drop_table("thread_events")
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from app.dependencies import get_azure_client
+from app.dependencies import AIProjectClient, get_agent_client
+from app.services.endpoint_router import EndpointRouter, get_endpoint_router
 from app.database import get_db, create_tables
-from app.models import Agent
-from azure.ai.projects import AIProjectClient
+from app.models import Agent, AgentPolicy
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from sqlalchemy import or_
+from sqlalchemy.dialects.mysql import match
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/agents", tags=["agents"])
@@ -16,6 +18,28 @@ class AgentCreateRequest(BaseModel):
     model: str = "gpt-4o"
     instructions: str
 
+class AgentPolicyRequest(BaseModel):
+    """Modelo para configurar la política de un agente"""
+    context_max_messages: Optional[int] = None
+    context_max_tokens: Optional[int] = None
+    context_keep_last: int = 4
+    cache_enabled: bool = False
+    cache_ttl_seconds: int = 3600
+    cache_similarity_threshold: Optional[float] = None
+
+def serialize_policy_for_response(policy):
+    """Convierte una política de la BD a diccionario para respuesta JSON"""
+    return {
+        "agent_id": policy.agent_id,
+        "context_max_messages": policy.context_max_messages,
+        "context_max_tokens": policy.context_max_tokens,
+        "context_keep_last": policy.context_keep_last,
+        "cache_enabled": policy.cache_enabled,
+        "cache_ttl_seconds": policy.cache_ttl_seconds,
+        "cache_similarity_threshold": policy.cache_similarity_threshold,
+        "updated_at": policy.updated_at.isoformat() if policy.updated_at else ""
+    }
+
 def serialize_agent_for_response(agent):
     """Convierte un agente de la BD a diccionario para respuesta JSON"""
     return {
@@ -36,21 +60,24 @@ def serialize_agent_for_response(agent):
     }
 
 @router.get("/")
-async def list_agents(azure_client: AIProjectClient = Depends(get_azure_client)):
+async def list_agents(endpoint_router: EndpointRouter = Depends(get_endpoint_router)):
     """Listar todos los agentes desde Azure Foundry"""
     try:
-        # Obtener lista de agentes desde Azure Foundry
-        agents = azure_client.agents.list_agents()
+        # Obtener lista de agentes desde todos los endpoints de Azure Foundry
+        results, unavailable = endpoint_router.gather(
+            lambda azure_client: list(azure_client.agents.list_agents())
+        )
         
         # Convertir a lista para serialización
         agents_list = []
-        for agent in agents:
-            agents_list.append(agent)
+        for _, agents in results:
+            agents_list.extend(agents)
         
         return {
             "success": True,
             "count": len(agents_list),
-            "agents": agents_list
+            "agents": agents_list,
+            "unavailable_endpoints": unavailable
         }
         
     except Exception as e:
@@ -83,20 +110,89 @@ async def list_agents_from_db(db: Session = Depends(get_db)):
             detail=f"Error al listar agentes desde BD: {str(e)}"
         )
 
+@router.get("/search")
+async def search_agents(
+    q: Optional[str] = Query(None, description="Texto a buscar en nombre, descripción e instrucciones"),
+    name: Optional[str] = Query(None, description="Prefijo del nombre"),
+    model: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: Literal["created_at", "name", "model", "relevance"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """Buscar agentes en la base de datos con filtros, orden y texto libre"""
+    try:
+        query = db.query(Agent)
+        relevance = None
+        
+        # Filtros (cubiertos por los índices compuestos con created_at)
+        if name:
+            # Escapar comodines para que el nombre se compare literalmente
+            prefix = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.filter(Agent.name.like(f"{prefix}%", escape="\\"))
+        if model:
+            query = query.filter(Agent.model == model)
+        if created_after:
+            query = query.filter(Agent.created_at >= created_after)
+        if created_before:
+            query = query.filter(Agent.created_at < created_before)
+        
+        # Texto libre: índice FULLTEXT en MySQL, LIKE en otros motores
+        if q:
+            if db.get_bind().dialect.name == "mysql":
+                relevance = match(Agent.name, Agent.description, Agent.instructions, against=q)
+                query = query.filter(relevance)
+            else:
+                pattern = f"%{q}%"
+                query = query.filter(or_(
+                    Agent.name.ilike(pattern),
+                    Agent.description.ilike(pattern),
+                    Agent.instructions.ilike(pattern)
+                ))
+        
+        # Ordenación
+        if sort == "relevance" and relevance is not None:
+            sort_column = relevance
+        else:
+            sort_column = getattr(Agent, sort if sort != "relevance" else "created_at")
+        query = query.order_by(sort_column.asc() if order == "asc" else sort_column.desc())
+        
+        agents = query.offset(offset).limit(limit).all()
+        
+        return {
+            "success": True,
+            "count": len(agents),
+            "limit": limit,
+            "offset": offset,
+            "agents": [serialize_agent_for_response(agent) for agent in agents]
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al buscar agentes: {str(e)}"
+        )
+
 @router.post("/")
 async def create_agent(
     request: AgentCreateRequest,
-    azure_client: AIProjectClient = Depends(get_azure_client),
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
     db: Session = Depends(get_db)
 ):
     """Crear nuevo agente"""
     try:
-        # Crear agente en Azure Foundry
-        agent = azure_client.agents.create_agent(
-            model=request.model,
-            name=request.name,
-            instructions=request.instructions,
+        # Crear agente en el endpoint de Azure Foundry elegido por el enrutador
+        endpoint, agent = endpoint_router.call_with_failover(
+            lambda azure_client: azure_client.agents.create_agent(
+                model=request.model,
+                name=request.name,
+                instructions=request.instructions,
+            )
         )
+        endpoint_router.assign(agent.id, endpoint, "agent")
         
         # Guardar en base de datos
         db_agent = Agent(
@@ -124,6 +220,7 @@ async def create_agent(
         response = {
             "success": True,
             "message": "Agente creado exitosamente",
+            "endpoint": endpoint.name,
             "agent": serialize_agent_for_response(db_agent)
         }
         
@@ -139,7 +236,7 @@ async def create_agent(
 @router.get("/{agent_id}")
 async def get_agent(
     agent_id: str, 
-    azure_client: AIProjectClient = Depends(get_azure_client),
+    azure_client: AIProjectClient = Depends(get_agent_client),
     db: Session = Depends(get_db)
 ):
     """Obtener agente por ID desde Azure Foundry y base de datos"""
@@ -180,8 +277,61 @@ async def get_agent(
             detail=f"Agente con ID {agent_id} no encontrado: {str(e)}"
         )
 
+@router.get("/{agent_id}/policy")
+async def get_agent_policy(agent_id: str, db: Session = Depends(get_db)):
+    """Obtener la política (ventana de contexto y caché) de un agente"""
+    policy = db.query(AgentPolicy).filter(AgentPolicy.agent_id == agent_id).first()
+    
+    if policy is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"El agente {agent_id} no tiene política configurada"
+        )
+    
+    return {
+        "success": True,
+        "policy": serialize_policy_for_response(policy)
+    }
+
+@router.put("/{agent_id}/policy")
+async def update_agent_policy(
+    agent_id: str,
+    request: AgentPolicyRequest,
+    db: Session = Depends(get_db)
+):
+    """Crear o actualizar la política (ventana de contexto y caché) de un agente"""
+    try:
+        policy = db.query(AgentPolicy).filter(AgentPolicy.agent_id == agent_id).first()
+        
+        if policy is None:
+            policy = AgentPolicy(agent_id=agent_id)
+            db.add(policy)
+        
+        policy.context_max_messages = request.context_max_messages
+        policy.context_max_tokens = request.context_max_tokens
+        policy.context_keep_last = request.context_keep_last
+        policy.cache_enabled = request.cache_enabled
+        policy.cache_ttl_seconds = request.cache_ttl_seconds
+        policy.cache_similarity_threshold = request.cache_similarity_threshold
+        
+        db.commit()
+        db.refresh(policy)
+        
+        return {
+            "success": True,
+            "message": "Política actualizada exitosamente",
+            "policy": serialize_policy_for_response(policy)
+        }
+        
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error al actualizar política del agente {agent_id}: {str(e)}"
+        )
+
 @router.put("/{agent_id}")
-async def update_agent(agent_id: str, azure_client: AIProjectClient = Depends(get_azure_client)):
+async def update_agent(agent_id: str, azure_client: AIProjectClient = Depends(get_agent_client)):
     """Actualizar agente"""
     # TODO: Implementar actualización de agente
     return {"message": f"Actualizar agente {agent_id} - Pendiente de implementar"}
@@ -189,7 +339,8 @@ async def update_agent(agent_id: str, azure_client: AIProjectClient = Depends(ge
 @router.delete("/{agent_id}")
 async def delete_agent(
     agent_id: str, 
-    azure_client: AIProjectClient = Depends(get_azure_client),
+    azure_client: AIProjectClient = Depends(get_agent_client),
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
     db: Session = Depends(get_db)
 ):
     """Eliminar agente por ID desde Azure Foundry y base de datos"""
@@ -212,9 +363,12 @@ async def delete_agent(
         
         if db_agent:
             db.delete(db_agent)
-            db.commit()
             deleted_from_db = True
         
+        db.query(AgentPolicy).filter(AgentPolicy.agent_id == agent_id).delete()
+        db.commit()
+        endpoint_router.forget([agent_id])
+        
         # Preparar respuesta
         response = {
             "success": True,
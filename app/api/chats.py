@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from app.dependencies import get_azure_client
-from azure.ai.projects import AIProjectClient
-from azure.ai.agents.models import ListSortOrder
-import time
+from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Any, Callable
+from app.database import get_db
+from app.services.endpoint_router import Endpoint, EndpointRouter, get_endpoint_router
+from app.services.context_window import resolve_thread_id
+from app.services.events import event_broker, message_event
+from app.services.response_cache import append_cached_turn, get_cache_policy, is_first_turn, lookup_response
+from app.services.thread_pool import get_thread_pool
+from app.services.run_queue import (
+    FINISHED_STATUSES,
+    RunWorkerPool,
+    get_run_worker_pool,
+    serialize_job,
+    serialize_message,
+)
+import asyncio
+import json
 
 router = APIRouter(prefix="/chats", tags=["chats"])
 
+# Intervalo de consulta del estado de un run al emitir eventos (segundos)
+RUN_EVENTS_POLL_INTERVAL = 0.5
+
 class MessageCreateRequest(BaseModel):
     """Modelo para crear un mensaje"""
     thread_id: str
@@ -20,12 +36,73 @@ class RunCreateRequest(BaseModel):
     thread_id: str
     agent_id: str
 
-@router.post("/messages")
+class ConversationStartRequest(BaseModel):
+    """Modelo para iniciar una conversación con su primer mensaje"""
+    agent_id: str
+    content: str
+
+def thread_endpoint(endpoint_router: EndpointRouter, thread_id: str, agent_id: str) -> Endpoint:
+    """Endpoint del thread, comprobando que el agente pertenece al mismo"""
+    endpoint = endpoint_router.owner(thread_id)
+    if endpoint_router.owner(agent_id) is not endpoint:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El thread {thread_id} y el agente {agent_id} pertenecen a endpoints distintos"
+        )
+    return endpoint
+
+async def ensure_thread_idle(run_pool: RunWorkerPool, thread_id: str) -> None:
+    """Rechazar operaciones sobre un thread con un run pendiente o en curso"""
+    if await run_pool.backend.thread_busy(thread_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"El thread {thread_id} tiene un run en curso; espera a que termine"
+        )
+
+def create_thread_on(endpoint_router: EndpointRouter, endpoint: Endpoint, **kwargs) -> str:
+    """Crear un thread en el endpoint indicado y registrarlo"""
+    thread = endpoint_router.client(endpoint).agents.threads.create(**kwargs)
+    endpoint_router.assign(thread.id, endpoint, "thread")
+    return thread.id
+
+def cached_reply(
+    db, policy, thread_id, content, azure_client, background_tasks,
+    new_thread: Optional[Callable[[], str]] = None
+) -> Optional[JSONResponse]:
+    """Respuesta desde la caché del agente, registrando el turno en segundo plano"""
+    cached_response = lookup_response(db, policy, content)
+    if cached_response is None:
+        return None
+    
+    if thread_id is None:
+        thread_id = new_thread()
+    
+    background_tasks.add_task(
+        append_cached_turn, azure_client, thread_id, content, cached_response
+    )
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            "message": "Respuesta obtenida desde caché",
+            "cached": True,
+            "data": {
+                "thread_id": thread_id,
+                "role": "assistant",
+                "content": cached_response
+            }
+        }
+    )
+
+@router.post("/messages", status_code=202)
 async def create_message(
     request: MessageCreateRequest,
-    azure_client: AIProjectClient = Depends(get_azure_client)
+    background_tasks: BackgroundTasks,
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
+    run_pool: RunWorkerPool = Depends(get_run_worker_pool),
+    db: Session = Depends(get_db)
 ):
-    """Crear mensaje en un thread"""
+    """Crear mensaje en un thread y encolar el run del agente"""
     try:
         # Validar rol del mensaje
         if request.role not in ["user", "assistant"]:
@@ -34,60 +111,230 @@ async def create_message(
                 detail="El rol debe ser 'user' o 'assistant'"
             )
         
+        # Si el thread se resumió, la conversación continúa en el nuevo thread
+        thread_id = resolve_thread_id(db, request.thread_id)
+        azure_client = endpoint_router.client(
+            thread_endpoint(endpoint_router, thread_id, request.agent_id)
+        )
+        
+        # Foundry no admite mensajes nuevos mientras el thread tiene un run activo
+        await ensure_thread_idle(run_pool, thread_id)
+        
+        # Preguntas repetidas se responden desde la caché del agente; solo el
+        # primer turno, porque los siguientes dependen de la conversación
+        policy = get_cache_policy(db, request.agent_id) if request.role == "user" else None
+        if policy is not None and not is_first_turn(azure_client, thread_id):
+            policy = None
+        if policy is not None:
+            cached = cached_reply(db, policy, thread_id, request.content, azure_client, background_tasks)
+            if cached is not None:
+                return cached
+        
         # Crear mensaje en Azure Foundry
         message = azure_client.agents.messages.create(
-            thread_id=request.thread_id,
+            thread_id=thread_id,
             role=request.role,
             content=request.content
         )
+        event_broker.publish(thread_id, message_event(thread_id, serialize_message(message)))
 
-        # Crear run y procesar
-        run = azure_client.agents.runs.create_and_process(
-            thread_id=request.thread_id,
-            agent_id=request.agent_id
+        # Encolar run; se procesa en segundo plano
+        job = await run_pool.submit(
+            thread_id=thread_id,
+            agent_id=request.agent_id,
+            message_id=message.id,
+            prompt=request.content if policy is not None else None
         )
-        
-        messages_list = []
-        if run.status == "failed":
-            print(f"Run failed: {run.last_error}")
-        else:
-            messages = azure_client.agents.messages.list(thread_id=request.thread_id, order=ListSortOrder.ASCENDING)
-            for message in messages:
-                messages_list.append({
-                    "id": message.id,
-                    "thread_id": request.thread_id,
-                    "role": message.role,
-                    "content": message.content,
-                    "created_at": message.created_at
-                })
-
-
 
         return {
             "success": True,
-            "message": "Mensaje creado exitosamente",
+            "message": "Mensaje creado exitosamente, run encolado",
             "data": {
                 "id": message.id,
-                "thread_id": request.thread_id,
+                "thread_id": thread_id,
                 "role": message.role,
                 "content": message.content,
                 "created_at": message.created_at
             },
+            "run": serialize_job(job)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"Error al crear mensaje: {str(e)}"
         )
 
+@router.post("/start", status_code=202)
+async def start_conversation(
+    request: ConversationStartRequest,
+    background_tasks: BackgroundTasks,
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
+    run_pool: RunWorkerPool = Depends(get_run_worker_pool),
+    db: Session = Depends(get_db)
+):
+    """Iniciar una conversación: thread, primer mensaje y run en una sola llamada"""
+    from azure.ai.agents.models import ThreadMessageOptions
+    
+    pooled = False
+    try:
+        # La conversación se crea en el endpoint del agente
+        endpoint = endpoint_router.owner(request.agent_id)
+        azure_client = endpoint_router.client(endpoint)
+        
+        # Thread precreado del pool, si hay alguno disponible
+        thread_pool = get_thread_pool(endpoint.name)
+        thread_id = thread_pool.claim() if thread_pool else None
+        pooled = thread_id is not None
+        
+        policy = get_cache_policy(db, request.agent_id)
+        if policy is not None:
+            cached = cached_reply(
+                db, policy, thread_id, request.content, azure_client, background_tasks,
+                new_thread=lambda: create_thread_on(endpoint_router, endpoint)
+            )
+            if cached is not None:
+                return cached
+        
+        message_id = None
+        if pooled:
+            message = azure_client.agents.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=request.content
+            )
+            message_id = message.id
+        else:
+            # Sin pool: crear thread y primer mensaje en una sola llamada
+            thread_id = create_thread_on(
+                endpoint_router,
+                endpoint,
+                messages=[ThreadMessageOptions(role="user", content=request.content)]
+            )
+        
+        job = await run_pool.submit(
+            thread_id=thread_id,
+            agent_id=request.agent_id,
+            message_id=message_id,
+            prompt=request.content if policy is not None else None
+        )
+        
+        return {
+            "success": True,
+            "message": "Conversación iniciada, run encolado",
+            "thread_id": thread_id,
+            "pooled_thread": pooled,
+            "run": serialize_job(job)
+        }
+        
+    except Exception as e:
+        # El thread del pool no llegó al cliente: eliminarlo para no dejarlo huérfano
+        if pooled:
+            thread_pool.discard(thread_id)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error al iniciar conversación: {str(e)}"
+        )
+
+@router.post("/runs", status_code=202)
+async def create_run(
+    request: RunCreateRequest,
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
+    run_pool: RunWorkerPool = Depends(get_run_worker_pool),
+    db: Session = Depends(get_db)
+):
+    """Encolar un run sobre un thread existente"""
+    try:
+        thread_id = resolve_thread_id(db, request.thread_id)
+        thread_endpoint(endpoint_router, thread_id, request.agent_id)
+        await ensure_thread_idle(run_pool, thread_id)
+        
+        job = await run_pool.submit(
+            thread_id=thread_id,
+            agent_id=request.agent_id
+        )
+        
+        return {
+            "success": True,
+            "message": "Run encolado exitosamente",
+            "run": serialize_job(job)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error al encolar run: {str(e)}"
+        )
+
+@router.get("/runs/{job_id}")
+async def get_run(
+    job_id: str,
+    run_pool: RunWorkerPool = Depends(get_run_worker_pool)
+):
+    """Consultar el estado de un run encolado"""
+    job = await run_pool.backend.get(job_id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Run con ID {job_id} no encontrado"
+        )
+    
+    return {
+        "success": True,
+        "run": serialize_job(job)
+    }
+
+@router.get("/runs/{job_id}/events")
+async def stream_run(
+    job_id: str,
+    run_pool: RunWorkerPool = Depends(get_run_worker_pool)
+):
+    """Emitir por Server-Sent Events los cambios de estado de un run"""
+    job = await run_pool.backend.get(job_id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Run con ID {job_id} no encontrado"
+        )
+    
+    async def event_stream():
+        last_status = None
+        while True:
+            current = await run_pool.backend.get(job_id)
+            if current is None:
+                break
+            
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield f"event: {last_status}\ndata: {json.dumps(serialize_job(current))}\n\n"
+            
+            if last_status in FINISHED_STATUSES:
+                break
+            
+            await asyncio.sleep(RUN_EVENTS_POLL_INTERVAL)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/threads/{thread_id}/messages")
 async def get_messages(
     thread_id: str, 
-    azure_client: AIProjectClient = Depends(get_azure_client)
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router),
+    db: Session = Depends(get_db)
 ):
     """Obtener mensajes de un thread"""
+    from azure.ai.agents.models import ListSortOrder
+    
     try:
+        # Si el thread se resumió, la conversación continúa en el nuevo thread
+        thread_id = resolve_thread_id(db, thread_id)
+        azure_client = endpoint_router.client_for(thread_id)
+        
         # Obtener mensajes desde Azure Foundry
         messages = azure_client.agents.messages.list(
             thread_id=thread_id,
@@ -1,35 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from app.dependencies import get_azure_client
-from azure.ai.projects import AIProjectClient
-from azure.ai.agents.models import FileSearchToolDefinition, ToolResources, FileSearchToolResource
+from app.dependencies import AIProjectClient, get_file_client
+from app.services.endpoint_router import EndpointRouter, get_endpoint_router
+from app.services.response_cache import touch_agent
+import logging
 import time
 import io
 
+# Configurar logging
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/files", tags=["files"])
 
 @router.get("/")
-async def list_files(azure_client: AIProjectClient = Depends(get_azure_client)):
+async def list_files(endpoint_router: EndpointRouter = Depends(get_endpoint_router)):
     """Listar todos los archivos"""
     try:
-        # Obtener lista de archivos desde Azure Foundry
-        files = azure_client.agents.files.list()
+        # Obtener lista de archivos desde todos los endpoints de Azure Foundry
+        results, unavailable = endpoint_router.gather(
+            lambda azure_client: azure_client.agents.files.list()
+        )
         
         # Convertir a lista para serialización
         files_list = []
-        for file in files.data:
-            files_list.append({
-                "id": file.id,
-                "object": file.object,
-                "created_at": file.created_at,
-                "filename": file.filename,
-                "purpose": file.purpose,
-                "bytes": file.bytes
-            })
+        for endpoint, files in results:
+            for file in files.data:
+                files_list.append({
+                    "id": file.id,
+                    "object": file.object,
+                    "created_at": file.created_at,
+                    "filename": file.filename,
+                    "purpose": file.purpose,
+                    "bytes": file.bytes,
+                    "endpoint": endpoint.name
+                })
         
         return {
             "success": True,
             "count": len(files_list),
-            "files": files_list
+            "files": files_list,
+            "unavailable_endpoints": unavailable
         }
         
     except Exception as e:
@@ -42,12 +51,17 @@ async def list_files(azure_client: AIProjectClient = Depends(get_azure_client)):
 async def upload_file(
     file: UploadFile = File(...),
     agent_id: str = Form(...),
-    azure_client: AIProjectClient = Depends(get_azure_client)
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router)
 ):
     """Subir archivo y asociarlo a un agente con vector store"""
     try:
+        # El archivo y el vector store se crean en el endpoint del agente
+        endpoint = endpoint_router.owner(agent_id)
+        azure_client = endpoint_router.client(endpoint)
+        
         # Paso 1: Subir archivo
         file_id = await upload_file_to_project(file, azure_client)
+        endpoint_router.assign(file_id, endpoint, "file")
         
         # Paso 2: Crear vector store
         vector_store_id = await create_vector_store_with_file(file_id, azure_client)
@@ -57,6 +71,7 @@ async def upload_file(
                 status_code=500,
                 detail="Error al crear vector store"
             )
+        endpoint_router.assign(vector_store_id, endpoint, "vector_store")
         
         # Paso 3: Asociar al agente
         association_success = await associate_vector_store_to_agent(
@@ -108,10 +123,10 @@ async def upload_file_to_project(file: UploadFile, azure_client: AIProjectClient
         
     except Exception as e:
         # Log más detallado para debugging
-        print(f"Error detallado en upload_file_to_project: {str(e)}")
-        print(f"Tipo de archivo: {type(file)}")
-        print(f"Nombre del archivo: {file.filename}")
-        print(f"Tamaño del archivo: {file.size}")
+        logger.error(
+            f"Error detallado en upload_file_to_project: {str(e)}",
+            extra={"upload_filename": file.filename, "content_type": file.content_type, "bytes": file.size}
+        )
         raise Exception(f"Error al subir archivo: {str(e)}")
 
 async def create_vector_store_with_file(file_id: str, azure_client: AIProjectClient):
@@ -134,10 +149,10 @@ async def create_vector_store_with_file(file_id: str, azure_client: AIProjectCli
             vs_status = azure_client.agents.vector_stores.get(vector_store.id)
             
             if vs_status.status == "completed":
-                print("Vectorización completada!")
+                logger.info(f"Vectorización completada ({vector_store.id})")
                 return vector_store.id
             elif vs_status.status == "failed":
-                print("Vectorización falló")
+                logger.error(f"Vectorización falló ({vector_store.id})")
                 return None
                 
             time.sleep(2)
@@ -154,6 +169,8 @@ async def associate_vector_store_to_agent(
     azure_client: AIProjectClient
 ):
     """Asociar vector store al agente"""
+    from azure.ai.agents.models import FileSearchToolDefinition, FileSearchToolResource, ToolResources
+    
     try:
         # Crear FileSearchToolDefinition
         file_search_tool = FileSearchToolDefinition()
@@ -174,13 +191,16 @@ async def associate_vector_store_to_agent(
             tool_resources=tool_resources
         )
         
+        # El conocimiento del agente cambia: invalidar sus respuestas cacheadas
+        touch_agent(agent_id)
+        
         return True
         
     except Exception as e:
         raise Exception(f"Error al asociar vector store: {str(e)}")
 
 @router.get("/{file_id}")
-async def get_file(file_id: str, azure_client: AIProjectClient = Depends(get_azure_client)):
+async def get_file(file_id: str, azure_client: AIProjectClient = Depends(get_file_client)):
     """Obtener archivo por ID"""
     try:
         file = azure_client.agents.files.get(file_id=file_id)
@@ -204,10 +224,15 @@ async def get_file(file_id: str, azure_client: AIProjectClient = Depends(get_azu
         )
 
 @router.delete("/{file_id}")
-async def delete_file(file_id: str, azure_client: AIProjectClient = Depends(get_azure_client)):
+async def delete_file(
+    file_id: str,
+    azure_client: AIProjectClient = Depends(get_file_client),
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router)
+):
     """Eliminar archivo"""
     try:
         azure_client.agents.files.delete(file_id=file_id)
+        endpoint_router.forget([file_id])
         
         return {
             "success": True,
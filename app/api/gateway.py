@@ -0,0 +1,428 @@
+"""
+Gateway WebSocket de chat
+
+Una sola conexión puede seguir varios threads a la vez: se suscribe a ellos,
+envía mensajes y recibe en tiempo real los cambios de estado de los runs y los
+mensajes nuevos, sin sondear la API.
+
+Mensajes del cliente (JSON; el campo opcional "id" se devuelve en la respuesta):
+    {"type": "subscribe", "thread_id": "...", "history": true}
+    {"type": "unsubscribe", "thread_id": "..."}
+    {"type": "send", "thread_id": "...", "agent_id": "...", "content": "..."}
+    {"type": "start", "agent_id": "...", "content": "..."}
+    {"type": "pong"}
+
+Eventos del servidor: subscribed, unsubscribed, history, accepted, started,
+cached, run, message, ping y error.
+
+Contrapresión: los eventos salientes pasan por una cola acotada
+(WS_SEND_QUEUE_SIZE) y, si el cliente no la vacía a tiempo, la conexión se
+cierra con 1013 en lugar de acumular memoria. Los mensajes del cliente se
+procesan de uno en uno y los envíos pasan por el control de admisión de chat.
+Sin mensajes del cliente durante WS_IDLE_TIMEOUT segundos se cierra con 4408.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from app.api.chats import create_thread_on, ensure_thread_idle, thread_endpoint
+from app.config import settings
+from app.database import SessionLocal
+from app.middleware.admission import admission_controller, tenant_id
+from app.services.context_window import resolve_thread_id
+from app.services.endpoint_router import Endpoint, get_endpoint_router
+from app.services.events import event_broker, message_event
+from app.services.response_cache import append_cached_turn, get_cache_policy, is_first_turn, lookup_response
+from app.services.thread_pool import get_thread_pool
+from app.services.run_queue import (
+    FINISHED_STATUSES,
+    RunWorkerPool,
+    get_run_worker_pool,
+    serialize_job,
+    serialize_message,
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/chats", tags=["chats"])
+
+# Códigos de cierre
+CLOSE_SLOW_CONSUMER = 1013
+CLOSE_IDLE = 4408
+
+# Estados de job recordados por conexión para no repetir eventos
+MAX_TRACKED_JOBS = 1000
+
+def _history(thread_id: str) -> List[Dict[str, Any]]:
+    """Mensajes existentes de un thread, del más antiguo al más reciente"""
+    from azure.ai.agents.models import ListSortOrder
+
+    azure_client = get_endpoint_router().client_for(thread_id)
+    messages = azure_client.agents.messages.list(thread_id=thread_id, order=ListSortOrder.ASCENDING)
+    return [serialize_message(message) for message in messages]
+
+def _resolve_thread(thread_id: str) -> str:
+    db = SessionLocal()
+    try:
+        return resolve_thread_id(db, thread_id)
+    finally:
+        db.close()
+
+def _post_message(thread_id: str, agent_id: str, content: str) -> Dict[str, Any]:
+    """Crear el mensaje del usuario o, si está en caché, devolver la respuesta"""
+    endpoint_router = get_endpoint_router()
+    db = SessionLocal()
+    try:
+        azure_client = endpoint_router.client(thread_endpoint(endpoint_router, thread_id, agent_id))
+
+        # Solo el primer turno de la conversación se cachea
+        policy = get_cache_policy(db, agent_id)
+        if policy is not None and not is_first_turn(azure_client, thread_id):
+            policy = None
+        if policy is not None:
+            cached_response = lookup_response(db, policy, content)
+            if cached_response is not None:
+                return {
+                    "thread_id": thread_id,
+                    "content": content,
+                    "cached_response": cached_response,
+                    "azure_client": azure_client
+                }
+
+        message = azure_client.agents.messages.create(thread_id=thread_id, role="user", content=content)
+        return {
+            "thread_id": thread_id,
+            "message": serialize_message(message),
+            "prompt": content if policy is not None else None
+        }
+    finally:
+        db.close()
+
+def _start_conversation(endpoint: Endpoint, thread_id: Optional[str], agent_id: str, content: str) -> Dict[str, Any]:
+    """Primer mensaje de una conversación, en un thread precreado o en uno nuevo"""
+    from azure.ai.agents.models import ThreadMessageOptions
+
+    endpoint_router = get_endpoint_router()
+    azure_client = endpoint_router.client(endpoint)
+    db = SessionLocal()
+    try:
+        policy = get_cache_policy(db, agent_id)
+        if policy is not None:
+            cached_response = lookup_response(db, policy, content)
+            if cached_response is not None:
+                if thread_id is None:
+                    thread_id = create_thread_on(endpoint_router, endpoint)
+                return {
+                    "thread_id": thread_id,
+                    "content": content,
+                    "cached_response": cached_response,
+                    "azure_client": azure_client
+                }
+
+        message = None
+        if thread_id is not None:
+            message = serialize_message(
+                azure_client.agents.messages.create(thread_id=thread_id, role="user", content=content)
+            )
+        else:
+            # Sin pool: crear thread y primer mensaje en una sola llamada
+            thread_id = create_thread_on(
+                endpoint_router,
+                endpoint,
+                messages=[ThreadMessageOptions(role="user", content=content)]
+            )
+
+        return {
+            "thread_id": thread_id,
+            "message": message,
+            "prompt": content if policy is not None else None
+        }
+    finally:
+        db.close()
+
+def _required(request: Dict[str, Any], *fields: str) -> List[str]:
+    values = []
+    for field in fields:
+        value = request.get(field)
+        if not isinstance(value, str) or not value:
+            raise HTTPException(status_code=400, detail=f"Falta el campo '{field}'")
+        values.append(value)
+    return values
+
+class GatewayConnection:
+    """Una conexión WebSocket con sus suscripciones y su cola de salida"""
+
+    def __init__(self, websocket: WebSocket, run_pool: RunWorkerPool):
+        self.websocket = websocket
+        self.run_pool = run_pool
+        self.tenant = tenant_id(websocket.scope)
+        self.threads: Set[str] = set()
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.overflowed = asyncio.Event()
+        self.last_seen = time.monotonic()
+
+        # Último estado enviado de cada job
+        self._job_status: "OrderedDict[str, str]" = OrderedDict()
+        self._background: Set[asyncio.Task] = set()
+
+        self._handlers = {
+            "subscribe": self._subscribe,
+            "unsubscribe": self._unsubscribe,
+            "send": self._send_message,
+            "start": self._start,
+            "pong": self._pong,
+        }
+
+    async def serve(self) -> None:
+        tasks = [
+            asyncio.create_task(self._receive()),
+            asyncio.create_task(self._send()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._backpressure()),
+        ]
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for thread_id in self.threads:
+                event_broker.unsubscribe(thread_id, self.deliver)
+            self.threads.clear()
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+            for task in tasks:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.info(f"Conexión WebSocket terminada: {task.exception()!r}")
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        """Recibir un evento del broker (no bloquea)"""
+        if event["type"] == "run":
+            run = event["run"]
+            if self._job_status.get(run["id"]) == run["status"]:
+                return
+            self._job_status[run["id"]] = run["status"]
+            self._job_status.move_to_end(run["id"])
+            while len(self._job_status) > MAX_TRACKED_JOBS:
+                self._job_status.popitem(last=False)
+
+            # La conversación sigue en el thread resumido, que ocupa su lugar
+            if run["status"] in FINISHED_STATUSES and run.get("next_thread_id"):
+                self._unfollow(run["thread_id"])
+                if len(self.threads) < settings.WS_MAX_SUBSCRIPTIONS:
+                    self._follow(run["next_thread_id"])
+
+        self.offer(event)
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        """Encolar un evento de salida; si la cola está llena, cerrar la conexión"""
+        if self.overflowed.is_set():
+            return
+        try:
+            self.outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"Cliente WebSocket demasiado lento ({self.tenant}): cola de salida llena")
+            self.overflowed.set()
+
+    def _check_capacity(self, thread_id: Optional[str] = None) -> None:
+        """Rechazar seguir un thread más si se alcanzaría WS_MAX_SUBSCRIPTIONS"""
+        if thread_id in self.threads:
+            return
+        if len(self.threads) >= settings.WS_MAX_SUBSCRIPTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Máximo de {settings.WS_MAX_SUBSCRIPTIONS} threads suscritos por conexión"
+            )
+
+    def _follow(self, thread_id: str) -> None:
+        if thread_id not in self.threads:
+            self._check_capacity(thread_id)
+            self.threads.add(thread_id)
+            event_broker.subscribe(thread_id, self.deliver)
+
+    def _unfollow(self, thread_id: str) -> None:
+        if thread_id in self.threads:
+            self.threads.discard(thread_id)
+            event_broker.unsubscribe(thread_id, self.deliver)
+
+    async def _close(self, code: int, reason: str) -> None:
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _receive(self) -> None:
+        while True:
+            try:
+                text = await self.websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+            self.last_seen = time.monotonic()
+
+            try:
+                request = json.loads(text)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                self.offer({"type": "error", "status": 400, "detail": "Mensaje JSON inválido"})
+                continue
+
+            await self._handle(request)
+
+    async def _handle(self, request: Dict[str, Any]) -> None:
+        request_type = request.get("type")
+        handler = self._handlers.get(request_type)
+        try:
+            if handler is None:
+                raise HTTPException(status_code=400, detail=f"Tipo de mensaje desconocido: {request_type}")
+            response = await handler(request)
+        except HTTPException as e:
+            response = {"type": "error", "status": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                response["retry_after"] = int(e.headers["Retry-After"])
+        except Exception as e:
+            logger.error(f"Error al procesar mensaje WebSocket '{request_type}': {e}")
+            response = {"type": "error", "status": 400, "detail": f"Error al procesar '{request_type}': {str(e)}"}
+
+        if response is not None:
+            if "id" in request:
+                response["id"] = request["id"]
+            self.offer(response)
+
+    async def _send(self) -> None:
+        while True:
+            event = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(event, default=str))
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen >= settings.WS_IDLE_TIMEOUT:
+                logger.info(f"Cerrando conexión WebSocket inactiva ({self.tenant})")
+                await self._close(CLOSE_IDLE, "Conexión inactiva")
+                return
+            self.offer({"type": "ping"})
+
+    async def _backpressure(self) -> None:
+        await self.overflowed.wait()
+        await self._close(CLOSE_SLOW_CONSUMER, "Cliente demasiado lento")
+
+    @asynccontextmanager
+    async def _admitted(self):
+        """Aplicar a un envío los límites de la clase de ruta de chat"""
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+
+        limiter = admission_controller.limiters["chat"]
+        retry_after = await limiter.acquire(self.tenant)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail="Demasiadas peticiones, inténtalo más tarde",
+                headers={"Retry-After": str(max(1, round(retry_after)))}
+            )
+        try:
+            yield
+        finally:
+            limiter.release(self.tenant)
+
+    async def _subscribe(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        requested_id, = _required(request, "thread_id")
+        thread_id = await run_in_threadpool(_resolve_thread, requested_id)
+        self._follow(thread_id)
+        self.offer({"type": "subscribed", "thread_id": thread_id, "requested_thread_id": requested_id})
+
+        if not request.get("history"):
+            return None
+        messages = await run_in_threadpool(_history, thread_id)
+        return {"type": "history", "thread_id": thread_id, "messages": messages}
+
+    async def _unsubscribe(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        thread_id, = _required(request, "thread_id")
+        self._unfollow(thread_id)
+        return {"type": "unsubscribed", "thread_id": thread_id}
+
+    async def _send_message(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        thread_id, agent_id, content = _required(request, "thread_id", "agent_id", "content")
+        async with self._admitted():
+            # Si el thread se resumió, la conversación continúa en el nuevo thread
+            thread_id = await run_in_threadpool(_resolve_thread, thread_id)
+            # Comprobar el límite antes de crear el mensaje: el thread se sigue al encolar
+            self._check_capacity(thread_id)
+            await ensure_thread_idle(self.run_pool, thread_id)
+            posted = await run_in_threadpool(_post_message, thread_id, agent_id, content)
+            return await self._enqueue_run(posted, agent_id, {"type": "accepted"})
+
+    async def _start(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        agent_id, content = _required(request, "agent_id", "content")
+        self._check_capacity()
+        async with self._admitted():
+            endpoint = get_endpoint_router().owner(agent_id)
+
+            # Thread precreado del pool, si hay alguno disponible
+            thread_pool = get_thread_pool(endpoint.name)
+            thread_id = thread_pool.claim() if thread_pool else None
+
+            try:
+                posted = await run_in_threadpool(_start_conversation, endpoint, thread_id, agent_id, content)
+                return await self._enqueue_run(
+                    posted, agent_id, {"type": "started", "pooled_thread": thread_id is not None}
+                )
+            except Exception:
+                # El thread del pool no llegó al cliente: eliminarlo para no dejarlo huérfano
+                if thread_id is not None:
+                    thread_pool.discard(thread_id)
+                raise
+
+    async def _pong(self, request: Dict[str, Any]) -> None:
+        return None
+
+    async def _enqueue_run(self, posted: Dict[str, Any], agent_id: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Seguir el thread y encolar su run, o responder desde la caché"""
+        thread_id = posted["thread_id"]
+        self._follow(thread_id)
+
+        if "cached_response" in posted:
+            # El turno se registra en el thread en segundo plano
+            task = asyncio.create_task(run_in_threadpool(
+                append_cached_turn, posted["azure_client"], thread_id, posted["content"], posted["cached_response"]
+            ))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return {
+                "type": "cached",
+                "thread_id": thread_id,
+                "role": "assistant",
+                "content": posted["cached_response"]
+            }
+
+        message = posted["message"]
+        if message is not None:
+            event_broker.publish(thread_id, message_event(thread_id, message))
+
+        job = await self.run_pool.submit(
+            thread_id=thread_id,
+            agent_id=agent_id,
+            message_id=message["id"] if message else None,
+            prompt=posted["prompt"]
+        )
+        run = serialize_job(job)
+        self._job_status[job["id"]] = run["status"]
+
+        return {**response, "thread_id": thread_id, "message": message, "run": run}
+
+@router.websocket("/ws")
+async def chat_gateway(websocket: WebSocket):
+    """Gateway WebSocket: varios threads por conexión con eventos en tiempo real"""
+    await websocket.accept()
+    connection = GatewayConnection(websocket, get_run_worker_pool())
+    await connection.serve()
@@ -1,5 +1,11 @@
 from fastapi import APIRouter
 from app.config import settings
+from app.middleware.admission import admission_controller
+from app.services.endpoint_router import get_endpoint_router
+from app.services.events import event_broker
+from app.services.thread_pool import thread_pool_stats
+from app.startup import startup_profiler
+from app.services.response_cache import response_cache
 import platform
 import sys
 from datetime import datetime
@@ -17,5 +23,33 @@ async def health_check():
         "environment": settings.ENVIRONMENT,
         "python_version": sys.version,
         "platform": platform.platform(),
-        "azure_endpoint_configured": bool(settings.AZURE_AI_ENDPOINT),
+        "azure_endpoint_configured": bool(settings.AZURE_AI_ENDPOINT or settings.AZURE_AI_ENDPOINTS),
+        "response_cache": response_cache.stats(),
+        "thread_pool": thread_pool_stats(),
+        "thread_events": event_broker.stats(),
+    }
+
+@router.get("/admission")
+async def admission_metrics():
+    """Estado del control de admisión por clase de ruta"""
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        "timestamp": datetime.now().isoformat(),
+        "classes": admission_controller.stats()
+    }
+
+@router.get("/endpoints")
+async def endpoint_metrics():
+    """Latencia, errores y disponibilidad de cada endpoint de Azure Foundry"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        **get_endpoint_router().stats()
+    }
+
+@router.get("/startup")
+async def startup_report():
+    """Informe de tiempos del arranque (fases e imports)"""
+    return {
+        "profile_enabled": settings.STARTUP_PROFILE,
+        **startup_profiler.report()
     }
@@ -1,30 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException
-from app.dependencies import get_azure_client
-from azure.ai.projects import AIProjectClient
+from typing import Optional
+from app.dependencies import AIProjectClient, get_thread_client
+from app.services.endpoint_router import EndpointRouter, get_endpoint_router
 
 router = APIRouter(prefix="/threads", tags=["threads"])
 
 @router.get("/")
-async def list_threads(azure_client: AIProjectClient = Depends(get_azure_client)):
+async def list_threads(endpoint_router: EndpointRouter = Depends(get_endpoint_router)):
     """Listar todos los threads"""
     try:
-        # Obtener lista de threads desde Azure Foundry
-        threads = azure_client.agents.threads.list()
+        # Obtener lista de threads desde todos los endpoints de Azure Foundry
+        results, unavailable = endpoint_router.gather(
+            lambda azure_client: list(azure_client.agents.threads.list())
+        )
         
         # Convertir a lista para serialización
         threads_list = []
-        for thread in threads:
-            threads_list.append({
-                "id": thread.id,
-                "object": thread.object,
-                "created_at": thread.created_at,
-                "metadata": thread.metadata
-            })
+        for endpoint, threads in results:
+            for thread in threads:
+                threads_list.append({
+                    "id": thread.id,
+                    "object": thread.object,
+                    "created_at": thread.created_at,
+                    "metadata": thread.metadata,
+                    "endpoint": endpoint.name
+                })
         
         return {
             "success": True,
             "count": len(threads_list),
-            "threads": threads_list
+            "threads": threads_list,
+            "unavailable_endpoints": unavailable
         }
         
     except Exception as e:
@@ -34,15 +40,23 @@ async def list_threads(azure_client: AIProjectClient = Depends(get_azure_client)
         )
 
 @router.post("/")
-async def create_thread(azure_client: AIProjectClient = Depends(get_azure_client)):
-    """Crear nuevo thread"""
+async def create_thread(
+    agent_id: Optional[str] = None,
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router)
+):
+    """Crear nuevo thread (en el endpoint del agente si se indica agent_id)"""
     try:
+        # Sin agent_id, el endpoint principal: el de los recursos sin registro
+        endpoint = endpoint_router.owner(agent_id) if agent_id else endpoint_router.primary
+        
         # Crear thread en Azure Foundry
-        thread = azure_client.agents.threads.create()
+        thread = endpoint_router.client(endpoint).agents.threads.create()
+        endpoint_router.assign(thread.id, endpoint, "thread")
         
         return {
             "success": True,
             "message": "Thread creado exitosamente",
+            "endpoint": endpoint.name,
             "thread": {
                 "id": thread.id,
                 "object": thread.object,
@@ -58,7 +72,7 @@ async def create_thread(azure_client: AIProjectClient = Depends(get_azure_client
         )
 
 @router.get("/{thread_id}")
-async def get_thread(thread_id: str, azure_client: AIProjectClient = Depends(get_azure_client)):
+async def get_thread(thread_id: str, azure_client: AIProjectClient = Depends(get_thread_client)):
     """Obtener thread por ID"""
     try:
         # Obtener thread desde Azure Foundry
@@ -81,7 +95,11 @@ async def get_thread(thread_id: str, azure_client: AIProjectClient = Depends(get
         )
 
 @router.delete("/{thread_id}")
-async def delete_thread(thread_id: str, azure_client: AIProjectClient = Depends(get_azure_client)):
+async def delete_thread(
+    thread_id: str,
+    azure_client: AIProjectClient = Depends(get_thread_client),
+    endpoint_router: EndpointRouter = Depends(get_endpoint_router)
+):
     """Eliminar thread"""
     try:
         # Verificar que el thread existe antes de eliminar
@@ -95,6 +113,7 @@ async def delete_thread(thread_id: str, azure_client: AIProjectClient = Depends(
         
         # Eliminar thread
         azure_client.agents.threads.delete(thread_id=thread_id)
+        endpoint_router.forget([thread_id])
         
         return {
             "success": True,
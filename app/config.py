@@ -18,8 +18,21 @@ class Settings:
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     
+    # Configuración del despliegue multi-worker (serve.py)
+    WORKERS: int = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))  # 1 si RUN_QUEUE_BACKEND=memory
+    MAX_REQUESTS: int = int(os.getenv("MAX_REQUESTS", "10000"))  # Reciclar worker tras N peticiones (0 = nunca)
+    MAX_REQUESTS_JITTER: int = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+    GRACEFUL_TIMEOUT: int = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+    KEEP_ALIVE: int = int(os.getenv("KEEP_ALIVE", "5"))
+    
     # Configuración de Azure AI
     AZURE_AI_ENDPOINT: str = os.getenv("AZURE_AI_ENDPOINT", "")
+    # Varios proyectos: "nombre=url|peso,nombre=url|peso" (vacío = solo AZURE_AI_ENDPOINT)
+    AZURE_AI_ENDPOINTS: str = os.getenv("AZURE_AI_ENDPOINTS", "")
+    ROUTER_EWMA_ALPHA: float = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))  # Peso de la última medida
+    ROUTER_FAILURE_THRESHOLD: int = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3"))  # Errores seguidos hasta la cuarentena
+    ROUTER_COOLDOWN: float = float(os.getenv("ROUTER_COOLDOWN", "30"))  # Segundos en cuarentena
+    ROUTER_RETRY_TOTAL: int = int(os.getenv("ROUTER_RETRY_TOTAL", "1"))  # Reintentos del SDK por endpoint con varios endpoints
     
     # Configuración de base de datos
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
@@ -29,6 +42,68 @@ class Settings:
     
     # Configuración de logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "info")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" o "text"
+    SLOW_REQUEST_THRESHOLD_MS: float = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+    
+    # Configuración del perfilado bajo demanda (?profile=1 con cabecera X-Profile-Token)
+    PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "")  # Vacío = perfilado desactivado
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    
+    # Configuración del arranque
+    STARTUP_PROFILE: bool = os.getenv("STARTUP_PROFILE", "False").lower() == "true"  # Medir coste de imports
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "True").lower() == "true"  # Precalentar SDK y BD tras arrancar
+    
+    # Configuración de la cola de runs
+    RUN_QUEUE_BACKEND: str = os.getenv("RUN_QUEUE_BACKEND", "memory")  # "memory" o "database"
+    RUN_WORKERS: int = int(os.getenv("RUN_WORKERS", "4"))
+    RUN_MAX_CONCURRENCY_PER_AGENT: int = int(os.getenv("RUN_MAX_CONCURRENCY_PER_AGENT", "2"))
+    RUN_QUEUE_POLL_INTERVAL: float = float(os.getenv("RUN_QUEUE_POLL_INTERVAL", "1.0"))
+    RUN_QUEUE_MAX_FINISHED: int = int(os.getenv("RUN_QUEUE_MAX_FINISHED", "1000"))
+    RUN_DRAIN_TIMEOUT: float = float(os.getenv("RUN_DRAIN_TIMEOUT", "25"))  # serve.py exige GRACEFUL_TIMEOUT >= RUN_DRAIN_TIMEOUT + 3
+    RUN_JOB_VISIBILITY_TIMEOUT: float = float(os.getenv("RUN_JOB_VISIBILITY_TIMEOUT", "120"))  # Segundos sin heartbeat hasta reclamar un job
+    
+    # Configuración del pool de threads precreados
+    THREAD_POOL_SIZE: int = int(os.getenv("THREAD_POOL_SIZE", "10"))  # 0 = desactivado
+    THREAD_POOL_MAX_IDLE: float = float(os.getenv("THREAD_POOL_MAX_IDLE", "3600"))
+    THREAD_POOL_REFILL_INTERVAL: float = float(os.getenv("THREAD_POOL_REFILL_INTERVAL", "30"))
+    
+    # Configuración del gateway WebSocket de chat
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", "15"))  # Segundos entre pings
+    WS_IDLE_TIMEOUT: float = float(os.getenv("WS_IDLE_TIMEOUT", "60"))  # Cierre sin mensajes del cliente
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))  # Eventos pendientes antes de cerrar
+    WS_MAX_SUBSCRIPTIONS: int = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))  # Threads por conexión
+    
+    # Configuración del relé de eventos entre procesos (solo con RUN_QUEUE_BACKEND=database)
+    EVENT_RELAY_POLL_INTERVAL: float = float(os.getenv("EVENT_RELAY_POLL_INTERVAL", "0.5"))
+    EVENT_RELAY_LOOKBACK: float = float(os.getenv("EVENT_RELAY_LOOKBACK", "5"))  # Ventana de lectura (segundos)
+    EVENT_RELAY_RETENTION: float = float(os.getenv("EVENT_RELAY_RETENTION", "300"))  # Antigüedad hasta borrar eventos
+    
+    # Configuración del control de admisión (límites por tenant)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+    ADMISSION_TENANT_HEADER: str = os.getenv("ADMISSION_TENANT_HEADER", "X-API-Key")
+    # API keys reconocidas como tenant (separadas por comas); el resto se identifica por IP
+    ADMISSION_API_KEYS: list = [key.strip() for key in os.getenv("ADMISSION_API_KEYS", "").split(",") if key.strip()]
+    ADMISSION_MAX_QUEUE_WAIT: float = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "5"))
+    # Runs de chat (POST /chats/...)
+    ADMISSION_CHAT_RATE: float = float(os.getenv("ADMISSION_CHAT_RATE", "2"))  # Peticiones/segundo por tenant
+    ADMISSION_CHAT_BURST: int = int(os.getenv("ADMISSION_CHAT_BURST", "10"))
+    ADMISSION_CHAT_TENANT_CONCURRENCY: int = int(os.getenv("ADMISSION_CHAT_TENANT_CONCURRENCY", "4"))
+    ADMISSION_CHAT_GLOBAL_CONCURRENCY: int = int(os.getenv("ADMISSION_CHAT_GLOBAL_CONCURRENCY", "64"))
+    # Subidas de archivos (POST /files/upload)
+    ADMISSION_UPLOAD_RATE: float = float(os.getenv("ADMISSION_UPLOAD_RATE", "0.2"))
+    ADMISSION_UPLOAD_BURST: int = int(os.getenv("ADMISSION_UPLOAD_BURST", "3"))
+    ADMISSION_UPLOAD_TENANT_CONCURRENCY: int = int(os.getenv("ADMISSION_UPLOAD_TENANT_CONCURRENCY", "2"))
+    ADMISSION_UPLOAD_GLOBAL_CONCURRENCY: int = int(os.getenv("ADMISSION_UPLOAD_GLOBAL_CONCURRENCY", "8"))
+    # Listados y resto de operaciones
+    ADMISSION_LISTING_RATE: float = float(os.getenv("ADMISSION_LISTING_RATE", "10"))
+    ADMISSION_LISTING_BURST: int = int(os.getenv("ADMISSION_LISTING_BURST", "50"))
+    ADMISSION_LISTING_TENANT_CONCURRENCY: int = int(os.getenv("ADMISSION_LISTING_TENANT_CONCURRENCY", "16"))
+    ADMISSION_LISTING_GLOBAL_CONCURRENCY: int = int(os.getenv("ADMISSION_LISTING_GLOBAL_CONCURRENCY", "256"))
+    
+    # Configuración de la caché de respuestas
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    RESPONSE_CACHE_EMBEDDING_MODEL: str = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "")  # Vacío = sin búsqueda semántica
+    RESPONSE_CACHE_OPENAI_API_VERSION: str = os.getenv("RESPONSE_CACHE_OPENAI_API_VERSION", "2024-10-21")
 
 # Instancia global de configuración
 settings = Settings()
@@ -1,13 +1,37 @@
+import threading
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 from app.models import Base
+from app.observability import instrument_engine
 
-# Crear engine de base de datos
-engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG)
+# Engine de base de datos (se crea en el primer uso)
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Obtener el engine de base de datos, creándolo si es necesario"""
+    global _engine
+    
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                # Los logs de SQL los configura configure_logging (sqlalchemy.engine)
+                _engine = create_engine(settings.DATABASE_URL)
+                instrument_engine(_engine)
+    
+    return _engine
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker que enlaza el engine al crear la primera sesión"""
+    
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
 
 # Crear sesión
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
 
 def get_db():
     """Dependencia para obtener sesión de base de datos"""
@@ -19,4 +43,4 @@ def get_db():
 
 def create_tables():
     """Crear todas las tablas"""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
@@ -1,34 +1,26 @@
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
-from app.config import settings
-import logging
+from typing import TYPE_CHECKING, Any
+from app.services.endpoint_router import get_endpoint_router
 
-# Configurar logging
-logger = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    from azure.ai.projects import AIProjectClient
+else:
+    # El SDK de Azure se importa al crear el cliente (arranque en frío más rápido);
+    # en tiempo de ejecución la anotación de las dependencias es Any
+    AIProjectClient = Any
 
-# Cliente de Azure AI (singleton)
-_azure_client = None
+def get_azure_client() -> "AIProjectClient":
+    """Cliente del endpoint principal"""
+    router = get_endpoint_router()
+    return router.client(router.primary)
 
-def get_azure_client() -> AIProjectClient:
-    global _azure_client
-    
-    if _azure_client is None:
-        try:
-            # Verificar configuración
-            if not settings.AZURE_AI_ENDPOINT:
-                raise ValueError("AZURE_AI_ENDPOINT no está configurado")
-           
-           # Crear cliente
-            _azure_client = AIProjectClient(
-                endpoint=settings.AZURE_AI_ENDPOINT,
-                credential=DefaultAzureCredential()
-            )
-            
-            logger.info("Cliente de Azure AI inicializado correctamente")
-            
-        except Exception as e:
-            logger.error(f"Error al inicializar cliente de Azure AI: {e}")
-            raise
-    
-    return _azure_client
+def get_agent_client(agent_id: str) -> "AIProjectClient":
+    """Cliente del endpoint al que pertenece el agente"""
+    return get_endpoint_router().client_for(agent_id)
 
+def get_thread_client(thread_id: str) -> "AIProjectClient":
+    """Cliente del endpoint al que pertenece el thread"""
+    return get_endpoint_router().client_for(thread_id)
+
+def get_file_client(file_id: str) -> "AIProjectClient":
+    """Cliente del endpoint al que pertenece el archivo"""
+    return get_endpoint_router().client_for(file_id)
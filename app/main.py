@@ -1,7 +1,44 @@
+from app.config import settings
+from app.observability import configure_logging
+from app.startup import complete_startup, startup_profiler
+
+configure_logging()
+
+# Medir el coste de import de cada módulo (antes de importar nada pesado)
+if settings.STARTUP_PROFILE:
+    startup_profiler.install()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.config import settings
-from app.api import health, agents, threads, files, chats
+
+with startup_profiler.phase("import_routers"):
+    from app.api import health, agents, threads, files, chats, gateway
+    from app.middleware.admission import AdmissionMiddleware, admission_controller
+    from app.middleware.observability import ObservabilityMiddleware
+    from app.services.events import start_event_relay, stop_event_relay
+    from app.services.run_queue import start_run_workers, stop_run_workers
+    from app.services.thread_pool import start_thread_pool, stop_thread_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada de los servicios en segundo plano"""
+    await start_event_relay()
+    with startup_profiler.phase("start_run_workers"):
+        await start_run_workers()
+    with startup_profiler.phase("start_thread_pool"):
+        await start_thread_pool()
+    startup_profiler.mark_ready()
+    
+    # El precalentamiento no bloquea: /health responde desde el primer momento
+    startup_task = asyncio.create_task(complete_startup(warmup=settings.STARTUP_WARMUP))
+    yield
+    startup_task.cancel()
+    await stop_thread_pool()
+    await stop_run_workers()
+    # Después de los workers: sus últimos eventos aún se reenvían
+    await stop_event_relay()
 
 # Crear instancia de FastAPI
 app = FastAPI(
@@ -9,9 +46,15 @@ app = FastAPI(
     description=settings.APP_DESCRIPTION,
     version=settings.APP_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+# Control de admisión por tenant (se registra antes que CORS para que las
+# respuestas 429 también lleven cabeceras CORS)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -19,14 +62,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# Request id, logs de acceso y perfilado (el más externo: mide la petición completa)
+app.add_middleware(ObservabilityMiddleware)
+
 # Registrar routers
 app.include_router(health.router)
 app.include_router(agents.router)
 app.include_router(threads.router)
 app.include_router(files.router)
 app.include_router(chats.router)
+app.include_router(gateway.router)
 
 @app.get("/")
 async def root():
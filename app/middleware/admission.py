@@ -0,0 +1,289 @@
+"""
+Control de admisión por tenant
+
+Cada petición se asigna a una clase de ruta (runs de chat, subidas o
+listados) y a un tenant (API key reconocida o IP). Por clase se aplica un
+token bucket y un límite de concurrencia por tenant, más un límite global cuya
+cola se reparte entre tenants por turnos (round-robin). Las peticiones
+rechazadas reciben 429 con cabecera Retry-After.
+
+El estado es local a cada proceso: con varios workers el límite efectivo es el
+configurado multiplicado por WORKERS.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Rutas que nunca se limitan
+EXEMPT_PATHS = ("/", "/docs", "/redoc", "/openapi.json")
+EXEMPT_PREFIXES = ("/health", "/docs/")
+
+# Número de tenants a partir del cual se purgan los buckets inactivos
+MAX_IDLE_BUCKETS = 10000
+
+class TokenBucket:
+    """Token bucket clásico: rate tokens por segundo hasta burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        """Consumir un token; devuelve 0 o los segundos hasta el siguiente token"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def is_full(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated_at) * self.rate >= self.burst
+
+class RouteClassLimiter:
+    """Límites de una clase de ruta con cola justa entre tenants"""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        tenant_concurrency: int,
+        global_concurrency: int,
+        max_queue_wait: float
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tenant_concurrency = tenant_concurrency
+        self.global_concurrency = global_concurrency
+        self.max_queue_wait = max_queue_wait
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._active: Dict[str, int] = {}
+        self._total_active = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._rotation: Deque[str] = deque()
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_rate = 0
+        self.rejected_concurrency = 0
+        self.rejected_timeout = 0
+
+    async def acquire(self, tenant: str) -> Optional[float]:
+        """Admitir la petición; devuelve None o los segundos de Retry-After"""
+        retry_after = self._bucket(tenant).take()
+        if retry_after > 0:
+            self.rejected_rate += 1
+            return retry_after
+
+        waiting = len(self._waiters.get(tenant, ()))
+        if self._active.get(tenant, 0) + waiting >= self.tenant_concurrency:
+            self.rejected_concurrency += 1
+            return 1.0
+
+        # Sin cola pendiente y con hueco global se admite directamente
+        if self._total_active < self.global_concurrency and not self._rotation:
+            self._admit(tenant)
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(tenant, deque()).append(future)
+        if tenant not in self._rotation:
+            self._rotation.append(tenant)
+        self.queued += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(future, timeout=self.max_queue_wait)
+            return None
+        except asyncio.TimeoutError:
+            self._forget_waiter(tenant, future)
+            self.rejected_timeout += 1
+            return self.max_queue_wait
+        except asyncio.CancelledError:
+            # Si ya se le había asignado hueco, se devuelve
+            if future.done() and not future.cancelled():
+                self.release(tenant)
+            else:
+                self._forget_waiter(tenant, future)
+            raise
+
+    def release(self, tenant: str) -> None:
+        self._active[tenant] -= 1
+        if not self._active[tenant]:
+            del self._active[tenant]
+        self._total_active -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._total_active,
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "tenants_active": len(self._active),
+            "limits": {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tenant_concurrency": self.tenant_concurrency,
+                "global_concurrency": self.global_concurrency
+            },
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_rate": self.rejected_rate,
+            "rejected_concurrency": self.rejected_concurrency,
+            "rejected_timeout": self.rejected_timeout
+        }
+
+    def _admit(self, tenant: str) -> None:
+        self._active[tenant] = self._active.get(tenant, 0) + 1
+        self._total_active += 1
+        self.admitted += 1
+
+    def _dispatch(self) -> None:
+        # Reparte los huecos libres entre tenants en orden round-robin
+        while self._total_active < self.global_concurrency and self._rotation:
+            tenant = self._rotation.popleft()
+            waiters = self._waiters[tenant]
+
+            while waiters and waiters[0].done():
+                waiters.popleft()  # Peticiones que agotaron su espera
+
+            if waiters:
+                self._admit(tenant)
+                waiters.popleft().set_result(True)
+
+            if waiters:
+                self._rotation.append(tenant)
+            else:
+                del self._waiters[tenant]
+
+    def _forget_waiter(self, tenant: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(tenant)
+        if waiters is None:
+            return
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            del self._waiters[tenant]
+            self._rotation.remove(tenant)
+
+    def _bucket(self, tenant: str) -> TokenBucket:
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                # Un bucket lleno equivale a uno nuevo, se puede descartar
+                self._buckets = {
+                    key: value for key, value in self._buckets.items() if not value.is_full()
+                }
+            bucket = self._buckets[tenant] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+class AdmissionController:
+    """Conjunto de limitadores por clase de ruta"""
+
+    def __init__(self, limiters: Dict[str, RouteClassLimiter]):
+        self.limiters = limiters
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        def limiter(name: str, prefix: str) -> RouteClassLimiter:
+            return RouteClassLimiter(
+                name=name,
+                rate=getattr(settings, f"ADMISSION_{prefix}_RATE"),
+                burst=getattr(settings, f"ADMISSION_{prefix}_BURST"),
+                tenant_concurrency=getattr(settings, f"ADMISSION_{prefix}_TENANT_CONCURRENCY"),
+                global_concurrency=getattr(settings, f"ADMISSION_{prefix}_GLOBAL_CONCURRENCY"),
+                max_queue_wait=settings.ADMISSION_MAX_QUEUE_WAIT
+            )
+
+        return cls({
+            "chat": limiter("chat", "CHAT"),
+            "upload": limiter("upload", "UPLOAD"),
+            "listing": limiter("listing", "LISTING")
+        })
+
+    @staticmethod
+    def classify(method: str, path: str) -> Optional[str]:
+        """Clase de ruta de una petición (None si está exenta)"""
+        if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES) or method == "OPTIONS":
+            return None
+        if method == "POST" and path.startswith("/files/upload"):
+            return "upload"
+        if method == "POST" and path.startswith("/chats/"):
+            return "chat"
+        return "listing"
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+# Hashes de las API keys reconocidas como tenant
+KNOWN_KEY_HASHES = {hashlib.sha256(key.encode()).hexdigest() for key in settings.ADMISSION_API_KEYS}
+
+def tenant_id(scope) -> str:
+    """Identificar al tenant por API key reconocida (hasheada) o por IP del cliente"""
+    # El servicio no autentica: una key arbitraria daría a cada petición un
+    # bucket nuevo, así que solo cuentan las configuradas en ADMISSION_API_KEYS
+    header = settings.ADMISSION_TENANT_HEADER.lower().encode()
+    for key, value in scope.get("headers", []):
+        if key == header and value:
+            digest = hashlib.sha256(value).hexdigest()
+            if digest in KNOWN_KEY_HASHES:
+                return "key:" + digest[:16]
+            break
+
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+class AdmissionMiddleware:
+    """Middleware ASGI que aplica el control de admisión"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.limiters[route_class]
+        tenant = tenant_id(scope)
+
+        retry_after = await limiter.acquire(tenant)
+        if retry_after is not None:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Demasiadas peticiones ({route_class}), reintente más tarde"},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(tenant)
+
+# Controlador de admisión (uno por proceso)
+admission_controller = AdmissionController.from_settings()
@@ -0,0 +1,142 @@
+"""
+Identificación, registro y perfilado de peticiones
+
+Asigna a cada petición un request_id (cabecera X-Request-ID), registra una
+línea de acceso estructurada y, si la petición supera SLOW_REQUEST_THRESHOLD_MS,
+un aviso con el desglose de tiempo por dependencia. Con ?profile=1 (o la
+cabecera X-Profile) y la cabecera X-Profile-Token correcta, la petición se
+ejecuta bajo el perfilador de muestreo pyinstrument: el perfil se guarda en
+PROFILE_DIR y, con ?profile=html, se devuelve en lugar de la respuesta.
+"""
+import hmac
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs
+
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.observability import request_id_var, request_timings_var
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# X-Request-ID recibidos que se aceptan (también se usan como nombre de archivo)
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def _pyinstrument():
+    """Importar pyinstrument bajo demanda; el perfilado es opcional"""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler
+
+class ObservabilityMiddleware:
+    """Middleware ASGI de request_id, logs de acceso y perfilado bajo demanda"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        profile_mode = self.requested_profile(scope, headers)
+        profile_path = os.path.join(settings.PROFILE_DIR, f"{request_id}.html") if profile_mode else None
+
+        timings = {}
+        request_token = request_id_var.set(request_id)
+        timings_token = request_timings_var.set(timings)
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+                if profile_path:
+                    message["headers"].append((b"x-profile-file", profile_path.encode()))
+
+            # Con ?profile=html la respuesta se sustituye por el perfil
+            if profile_mode != "html":
+                await send(message)
+
+        profiler = None
+        if profile_mode:
+            Profiler = _pyinstrument()
+            if Profiler is None:
+                logger.warning("Perfilado solicitado pero pyinstrument no está instalado")
+                profile_mode = profile_path = None
+            else:
+                try:
+                    profiler = Profiler(async_mode="enabled")
+                    profiler.start()
+                except RuntimeError as e:
+                    logger.warning(f"No se pudo iniciar el perfilado: {e}")
+                    profiler = None
+                    profile_mode = profile_path = None
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 2)
+
+            if profiler is not None:
+                profiler.stop()
+                html = profiler.output_html()
+                await run_in_threadpool(self.save_profile, profile_path, html)
+
+            log_fields = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": duration_ms,
+                "timings": timings,
+            }
+            if duration_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+                logger.warning(f"Petición lenta: {scope['method']} {scope['path']} ({duration_ms} ms)", extra=log_fields)
+            else:
+                logger.info(f"{scope['method']} {scope['path']} {status_code} ({duration_ms} ms)", extra=log_fields)
+
+            request_id_var.reset(request_token)
+            request_timings_var.reset(timings_token)
+
+        if profiler is not None and profile_mode == "html":
+            response = HTMLResponse(html, headers={"X-Request-ID": request_id})
+            await response(scope, receive, send)
+
+    @staticmethod
+    def requested_profile(scope, headers) -> Optional[str]:
+        """Modo de perfilado pedido ("1" o "html"), o None si no procede"""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        mode = (query.get("profile") or [headers.get(b"x-profile", b"").decode("latin-1")])[0]
+        if mode not in ("1", "html"):
+            return None
+
+        # Solo con la cabecera de administración correcta
+        token = headers.get(b"x-profile-token", b"")
+        if not settings.PROFILE_TOKEN or not hmac.compare_digest(token, settings.PROFILE_TOKEN.encode()):
+            return None
+        return mode
+
+    @staticmethod
+    def save_profile(path: str, html: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as profile_file:
+                profile_file.write(html)
+            logger.info(f"Perfil de la petición guardado en {path}")
+        except OSError as e:
+            logger.error(f"No se pudo guardar el perfil en {path}: {e}")
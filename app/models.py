@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Float, Integer, DateTime, JSON
+from sqlalchemy import Column, String, Text, Float, Integer, DateTime, JSON, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -11,7 +11,7 @@ class Agent(Base):
     
     id = Column(String(255), primary_key=True)  # asst_xxx
     object_type = Column(String(50), default="assistant")
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     model = Column(String(100), nullable=False)
@@ -23,3 +23,80 @@ class Agent(Base):
     agent_metadata = Column(JSON, default=dict)  # Metadatos adicionales (renombrado)
     response_format = Column(String(50), default="auto")
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # Filtro por model o prefijo de name con orden por fecha (GET /agents/search)
+        Index("ix_agents_model_created_at", "model", "created_at"),
+        Index("ix_agents_name_created_at", "name", "created_at"),
+        # Búsqueda por texto (solo MySQL)
+        Index(
+            "ix_agents_fulltext", "name", "description", "instructions",
+            mysql_prefix="FULLTEXT"
+        ).ddl_if(dialect="mysql"),
+    )
+
+class RunJob(Base):
+    """Modelo para la cola persistente de runs"""
+    __tablename__ = "run_jobs"
+    
+    id = Column(String(64), primary_key=True)  # job_xxx
+    thread_id = Column(String(255), nullable=False)
+    agent_id = Column(String(255), nullable=False)
+    message_id = Column(String(255), nullable=True)
+    prompt = Column(Text, nullable=True)  # Solo se guarda si la caché de respuestas está activa
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, in_progress, completed, failed
+    run_id = Column(String(255), nullable=True)  # run_xxx en Azure Foundry
+    next_thread_id = Column(String(255), nullable=True)  # Thread que continúa la conversación tras resumirla
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)  # Mensajes generados por el run
+    created_at = Column(DateTime, default=func.now(), index=True)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Última renovación de la reserva del worker
+    completed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_run_jobs_thread_id_status", "thread_id", "status"),
+    )
+
+class AgentPolicy(Base):
+    """Modelo para las políticas de ejecución configurables por agente"""
+    __tablename__ = "agent_policies"
+    
+    agent_id = Column(String(255), primary_key=True)  # asst_xxx
+    context_max_messages = Column(Integer, nullable=True)  # None = sin límite
+    context_max_tokens = Column(Integer, nullable=True)  # Tokens de prompt del último run
+    context_keep_last = Column(Integer, default=4)  # Mensajes recientes que se copian al nuevo thread
+    cache_enabled = Column(Boolean, default=False)
+    cache_ttl_seconds = Column(Integer, default=3600)
+    cache_similarity_threshold = Column(Float, nullable=True)  # None = solo coincidencia exacta
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class ThreadLink(Base):
+    """Modelo que relaciona un thread resumido con el thread que lo continúa"""
+    __tablename__ = "thread_links"
+    
+    old_thread_id = Column(String(255), primary_key=True)
+    new_thread_id = Column(String(255), nullable=False, index=True)
+    agent_id = Column(String(255), nullable=False)
+    summarized_messages = Column(Integer, default=0)
+    created_at = Column(DateTime, default=func.now())
+
+class ResourceEndpoint(Base):
+    """Modelo que fija cada recurso de Azure Foundry al endpoint que lo creó"""
+    __tablename__ = "resource_endpoints"
+    
+    resource_id = Column(String(255), primary_key=True)  # asst_xxx, thread_xxx, assistant-xxx, vs_xxx
+    resource_type = Column(String(20), nullable=False)  # agent, thread, file, vector_store
+    endpoint = Column(String(100), nullable=False, index=True)  # Nombre en AZURE_AI_ENDPOINTS
+    created_at = Column(DateTime, default=func.now())
+
+class ThreadEvent(Base):
+    """Modelo para los eventos de thread compartidos entre procesos"""
+    __tablename__ = "thread_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    thread_id = Column(String(255), nullable=False)
+    origin = Column(String(32), nullable=False)  # Proceso que publicó el evento
+    payload = Column(Text, nullable=False)  # Evento serializado en JSON
+    created_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,131 @@
+"""
+Logging estructurado y tiempos por petición
+
+Cada petición HTTP recibe un request_id que se incluye en todas las líneas de
+log emitidas mientras se atiende. Las llamadas a dependencias (base de datos,
+Azure Foundry, embeddings) acumulan su duración en el contexto de la petición
+para poder desglosar el tiempo de las peticiones lentas.
+"""
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.config import settings
+
+# Identificador de la petición en curso
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Tiempos por dependencia de la petición en curso: {dependencia: {"count", "ms"}}
+request_timings_var: ContextVar[Optional[Dict[str, Dict[str, float]]]] = ContextVar("request_timings", default=None)
+
+# Librerías cuyo log INFO es demasiado detallado (cabeceras de cada petición)
+VERBOSE_LOGGERS = ("azure", "httpx")
+
+# Atributos propios de LogRecord (el resto son campos extra)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+def record_timing(dependency: str, seconds: float) -> None:
+    """Sumar la duración de una llamada a una dependencia de la petición en curso"""
+    timings = request_timings_var.get()
+    if timings is None:
+        return
+
+    timing = timings.setdefault(dependency, {"count": 0, "ms": 0.0})
+    timing["count"] += 1
+    timing["ms"] = round(timing["ms"] + seconds * 1000, 2)
+
+@contextmanager
+def timed(dependency: str):
+    """Medir un bloque como llamada a una dependencia"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(dependency, time.perf_counter() - start)
+
+def instrument_engine(engine) -> None:
+    """Medir las consultas de un engine de SQLAlchemy"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_timing("database", time.perf_counter() - conn.info["query_started_at"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started_at") if exception_context.connection else None
+        if started:
+            record_timing("database", time.perf_counter() - started.pop())
+
+class RequestIdFilter(logging.Filter):
+    """Añadir el request_id en curso a cada registro"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Formatear cada registro como una línea JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        request_id = getattr(record, "request_id", None)
+        if request_id and request_id != "-":
+            entry["request_id"] = request_id
+
+        # Campos pasados con extra={...}
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging() -> None:
+    """Configurar el logging de la aplicación según LOG_FORMAT y LOG_LEVEL"""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+        ))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    for name in VERBOSE_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # SQL en modo DEBUG por el handler común (no con echo, que añade el suyo)
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if settings.DEBUG else logging.WARNING)
+
+    if settings.LOG_FORMAT == "json":
+        # Los logs del servidor pasan por el mismo formato; el acceso lo registra
+        # el middleware de observabilidad (con request_id y duración)
+        for name in ("uvicorn", "uvicorn.error", "gunicorn.error"):
+            logging.getLogger(name).handlers = []
+            logging.getLogger(name).propagate = True
+        for name in ("uvicorn.access", "gunicorn.access"):
+            logging.getLogger(name).handlers = []
+            logging.getLogger(name).propagate = False
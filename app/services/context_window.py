@@ -0,0 +1,161 @@
+"""
+Ventana de contexto de las conversaciones
+
+Cuando un thread supera el límite de mensajes o de tokens definido en la
+política del agente, los turnos antiguos se resumen en un único mensaje y la
+conversación continúa en un thread nuevo. La relación entre ambos threads se
+guarda en la tabla thread_links.
+"""
+import itertools
+import logging
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.services.endpoint_router import get_endpoint_router
+from app.models import AgentPolicy, ThreadLink
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Resume la conversación que recibes de forma compacta. Conserva los hechos, "
+    "datos, decisiones y preguntas pendientes necesarios para continuarla. "
+    "Responde solo con el resumen."
+)
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior:\n"
+
+def message_text(message) -> str:
+    """Extraer el texto de un mensaje de Azure Foundry"""
+    if message.text_messages:
+        return message.text_messages[-1].text.value
+    return ""
+
+def resolve_thread_id(db: Session, thread_id: str) -> str:
+    """Devolver el thread que continúa la conversación de thread_id"""
+    link = db.query(ThreadLink).filter(ThreadLink.old_thread_id == thread_id).first()
+    return link.new_thread_id if link else thread_id
+
+def summarize_messages(azure_client, agent_id: str, messages: List) -> str:
+    """Resumir mensajes con el propio agente en un thread temporal"""
+    from azure.ai.agents.models import ListSortOrder, ThreadMessageOptions
+
+    transcript = "\n".join(
+        f"{message.role}: {message_text(message)}" for message in messages
+    )
+
+    thread = azure_client.agents.threads.create(
+        messages=[ThreadMessageOptions(role="user", content=transcript)]
+    )
+    try:
+        run = azure_client.agents.runs.create_and_process(
+            thread_id=thread.id,
+            agent_id=agent_id,
+            instructions=SUMMARY_INSTRUCTIONS
+        )
+        if run.status != "completed":
+            raise Exception(f"Run de resumen terminó con estado {run.status}: {run.last_error}")
+
+        replies = azure_client.agents.messages.list(
+            thread_id=thread.id,
+            run_id=run.id,
+            order=ListSortOrder.DESCENDING
+        )
+        for reply in replies:
+            if reply.role == "assistant":
+                return message_text(reply)
+        raise Exception("El run de resumen no generó respuesta")
+    finally:
+        azure_client.agents.threads.delete(thread_id=thread.id)
+
+def exceeds_policy(azure_client, policy: AgentPolicy, thread_id: str, prompt_tokens: Optional[int]) -> bool:
+    """Comprobar si el thread supera los límites de la política"""
+    if policy.context_max_tokens and prompt_tokens and prompt_tokens > policy.context_max_tokens:
+        return True
+
+    if policy.context_max_messages:
+        # Solo se recorren las páginas necesarias para superar el límite
+        messages = azure_client.agents.messages.list(thread_id=thread_id, limit=100)
+        count = sum(1 for _ in itertools.islice(messages, policy.context_max_messages + 1))
+        return count > policy.context_max_messages
+
+    return False
+
+def context_policy(db: Session, agent_id: str) -> Optional[AgentPolicy]:
+    """Política del agente si limita la ventana de contexto"""
+    policy = db.query(AgentPolicy).filter(AgentPolicy.agent_id == agent_id).first()
+    if policy is None or not (policy.context_max_messages or policy.context_max_tokens):
+        return None
+    return policy
+
+def needs_compaction(thread_id: str, agent_id: str, prompt_tokens: Optional[int] = None) -> bool:
+    """Comprobar si el thread supera la política del agente"""
+    db = SessionLocal()
+    try:
+        policy = context_policy(db, agent_id)
+        if policy is None:
+            return False
+        azure_client = get_endpoint_router().client_for(thread_id)
+        return exceeds_policy(azure_client, policy, thread_id, prompt_tokens)
+    finally:
+        db.close()
+
+def compact_thread(thread_id: str, agent_id: str) -> Optional[str]:
+    """Resumir los turnos antiguos del thread; devuelve el nuevo thread"""
+    from azure.ai.agents.models import ListSortOrder, ThreadMessageOptions
+
+    db = SessionLocal()
+    try:
+        policy = context_policy(db, agent_id)
+        if policy is None:
+            return None
+
+        endpoint_router = get_endpoint_router()
+        endpoint = endpoint_router.owner(thread_id)
+        azure_client = endpoint_router.client(endpoint)
+
+        messages = list(azure_client.agents.messages.list(
+            thread_id=thread_id,
+            order=ListSortOrder.ASCENDING
+        ))
+        keep_last = max(policy.context_keep_last or 0, 0)
+        older = messages[:-keep_last] if keep_last else messages
+        recent = messages[-keep_last:] if keep_last else []
+
+        if not older:
+            return None
+
+        summary = summarize_messages(azure_client, agent_id, older)
+
+        # Nuevo thread: resumen seguido de los mensajes recientes
+        new_thread = azure_client.agents.threads.create(
+            messages=[ThreadMessageOptions(role="assistant", content=SUMMARY_PREFIX + summary)] + [
+                ThreadMessageOptions(role=message.role, content=message_text(message))
+                for message in recent
+                if message_text(message)
+            ]
+        )
+        endpoint_router.assign(new_thread.id, endpoint, "thread")
+
+        # Los threads que apuntaban al antiguo pasan a apuntar al nuevo
+        db.query(ThreadLink).filter(ThreadLink.new_thread_id == thread_id).update(
+            {"new_thread_id": new_thread.id}
+        )
+        db.add(ThreadLink(
+            old_thread_id=thread_id,
+            new_thread_id=new_thread.id,
+            agent_id=agent_id,
+            summarized_messages=len(older)
+        ))
+        db.commit()
+
+        logger.info(f"Thread {thread_id} resumido ({len(older)} mensajes) y continuado en {new_thread.id}")
+        return new_thread.id
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
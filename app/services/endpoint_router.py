@@ -0,0 +1,370 @@
+"""
+Enrutado entre varios proyectos de Azure Foundry
+
+AZURE_AI_ENDPOINTS define varios endpoints de proyecto con peso. Cada petición
+HTTP del SDK actualiza la latencia y la tasa de errores (EWMA) de su endpoint.
+Los recursos nuevos se crean en un endpoint elegido según peso y métricas, y
+los existentes (agentes, threads, archivos) quedan fijados al endpoint que los
+creó mediante la tabla resource_endpoints. Tras varios errores seguidos un
+endpoint pasa a cuarentena y las llamadas sin estado se reintentan en otro.
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ResourceEndpoint
+from app.observability import record_timing
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Latencia supuesta para un endpoint todavía sin medidas (segundos)
+DEFAULT_LATENCY = 0.5
+
+# Multiplicador de la tasa de errores en la puntuación de un endpoint
+ERROR_PENALTY = 10
+
+# Recursos cuyo endpoint se mantiene en memoria
+MAX_CACHED_OWNERS = 10000
+
+class Endpoint:
+    """Proyecto de Azure Foundry con sus métricas de latencia y errores"""
+
+    def __init__(self, name: str, url: str, weight: float = 1.0):
+        self.name = name
+        self.url = url
+        self.weight = weight
+        self.client = None
+        self.latency: Optional[float] = None  # EWMA en segundos
+        self.error_rate = 0.0  # EWMA entre 0 y 1
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "weight": self.weight,
+            "available": self.available(),
+            "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "cooldown_remaining": max(0.0, round(self.cooldown_until - time.monotonic(), 1))
+        }
+
+def parse_endpoints(value: str, default_url: str) -> List[Endpoint]:
+    """Interpretar AZURE_AI_ENDPOINTS ("nombre=url|peso,nombre=url|peso")"""
+    if not value.strip():
+        return [Endpoint("default", default_url)]
+
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+
+        name, separator, rest = item.partition("=")
+        url, _, weight = rest.partition("|")
+        if not separator or not name.strip() or not url.strip():
+            raise ValueError(f"Endpoint mal configurado en AZURE_AI_ENDPOINTS: {item}")
+
+        endpoints.append(Endpoint(name.strip(), url.strip(), float(weight) if weight.strip() else 1.0))
+
+    names = [endpoint.name for endpoint in endpoints]
+    if len(set(names)) != len(names):
+        raise ValueError("Nombres de endpoint duplicados en AZURE_AI_ENDPOINTS")
+    return endpoints
+
+# Respuestas que indican que el endpoint no ha procesado la petición
+RETRIABLE_STATUS = (429, 502, 503, 504)
+
+def is_retriable(error: Exception) -> bool:
+    """Errores que permiten repetir la llamada en otro endpoint sin duplicarla"""
+    from azure.core.exceptions import ServiceRequestError
+
+    # ServiceRequestError: la petición no llegó a enviarse
+    return getattr(error, "status_code", None) in RETRIABLE_STATUS or isinstance(error, ServiceRequestError)
+
+def _create_client(url: str, **kwargs):
+    """Crear el cliente del SDK para un endpoint de proyecto"""
+    try:
+        # Verificar configuración
+        if not url:
+            raise ValueError("AZURE_AI_ENDPOINT no está configurado")
+
+        from azure.ai.projects import AIProjectClient
+        from azure.identity import DefaultAzureCredential
+
+        # Crear cliente
+        client = AIProjectClient(
+            endpoint=url,
+            credential=DefaultAzureCredential(),
+            **kwargs
+        )
+
+        logger.info(f"Cliente de Azure AI inicializado correctamente ({url})")
+        return client
+
+    except Exception as e:
+        logger.error(f"Error al inicializar cliente de Azure AI: {e}")
+        raise
+
+def _metrics_policy(router: "EndpointRouter", endpoint: Endpoint):
+    """Política del pipeline de azure-core que mide cada petición HTTP del endpoint"""
+    from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+    class EndpointMetricsPolicy(SansIOHTTPPolicy):
+        def on_request(self, request):
+            request.context["endpoint_started_at"] = time.perf_counter()
+            router.record_start(endpoint)
+
+        def on_response(self, request, response):
+            status = response.http_response.status_code
+            elapsed = time.perf_counter() - request.context["endpoint_started_at"]
+            record_timing(f"azure:{endpoint.name}", elapsed)
+            router.record(endpoint, elapsed, ok=status < 500 and status != 429)
+
+        def on_exception(self, request):
+            record_timing(f"azure:{endpoint.name}", time.perf_counter() - request.context["endpoint_started_at"])
+            router.record(endpoint, None, ok=False)
+
+    return EndpointMetricsPolicy()
+
+class EndpointRouter:
+    """Selección de endpoint por métricas y afinidad de recursos"""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        alpha: float,
+        failure_threshold: int,
+        cooldown: float,
+        retry_total: int
+    ):
+        if not endpoints:
+            raise ValueError("No hay endpoints de Azure AI configurados")
+
+        self.endpoints = endpoints
+        self.primary = endpoints[0]
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.retry_total = retry_total
+        self._by_name = {endpoint.name: endpoint for endpoint in endpoints}
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+
+    @property
+    def multi_endpoint(self) -> bool:
+        return len(self.endpoints) > 1
+
+    def client(self, endpoint: Endpoint):
+        """Cliente del SDK de un endpoint (se crea la primera vez)"""
+        if endpoint.client is None:
+            with self._client_lock:
+                if endpoint.client is None:
+                    kwargs = {"per_retry_policies": [_metrics_policy(self, endpoint)]}
+                    # Con varios endpoints el router reintenta en otro: el SDK
+                    # solo repite unas pocas veces en el mismo (por defecto, 10)
+                    if self.multi_endpoint:
+                        kwargs["retry_total"] = self.retry_total
+                    endpoint.client = _create_client(endpoint.url, **kwargs)
+        return endpoint.client
+
+    def client_for(self, resource_id: str):
+        """Cliente del endpoint al que pertenece un recurso"""
+        return self.client(self.owner(resource_id))
+
+    def choose(self, exclude: Iterable[str] = ()) -> Endpoint:
+        """Elegir endpoint para un recurso nuevo o una llamada sin estado"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.name not in exclude]
+        healthy = [endpoint for endpoint in candidates if endpoint.available()] or candidates
+        if len(healthy) == 1:
+            return healthy[0]
+
+        # Probabilidad proporcional al peso e inversa a latencia, carga y errores
+        with self._lock:
+            measured = [endpoint.latency for endpoint in healthy if endpoint.latency is not None]
+            default_latency = sum(measured) / len(measured) if measured else DEFAULT_LATENCY
+            scores = [
+                endpoint.weight / (
+                    max(endpoint.latency if endpoint.latency is not None else default_latency, 0.001)
+                    * (1 + endpoint.in_flight)
+                    * (1 + ERROR_PENALTY * endpoint.error_rate)
+                )
+                for endpoint in healthy
+            ]
+        return random.choices(healthy, weights=scores)[0]
+
+    def call_with_failover(self, operation: Callable[[Any], Any]) -> Tuple[Endpoint, Any]:
+        """Ejecutar una llamada sin estado, pasando a otro endpoint si falla"""
+        tried: List[str] = []
+        while True:
+            endpoint = self.choose(exclude=tried)
+            try:
+                return endpoint, operation(self.client(endpoint))
+            except Exception as e:
+                tried.append(endpoint.name)
+                if not is_retriable(e) or len(tried) == len(self.endpoints):
+                    raise
+                logger.warning(f"Llamada fallida en endpoint {endpoint.name}, se reintenta en otro: {e}")
+
+    def gather(self, operation: Callable[[Any], Any]) -> Tuple[List[Tuple[Endpoint, Any]], List[str]]:
+        """Ejecutar una operación en todos los endpoints (listados)"""
+        results = []
+        failed = []
+        for endpoint in self.endpoints:
+            try:
+                results.append((endpoint, operation(self.client(endpoint))))
+            except Exception as e:
+                if not self.multi_endpoint:
+                    raise
+                logger.warning(f"Endpoint {endpoint.name} no disponible para listado: {e}")
+                failed.append(endpoint.name)
+        return results, failed
+
+    def owner(self, resource_id: str) -> Endpoint:
+        """Endpoint al que pertenece un recurso (el principal si no está registrado)"""
+        if not self.multi_endpoint or not resource_id:
+            return self.primary
+
+        with self._lock:
+            name = self._owners.get(resource_id)
+            if name is not None:
+                self._owners.move_to_end(resource_id)
+
+        if name is None:
+            db = SessionLocal()
+            try:
+                row = db.query(ResourceEndpoint.endpoint).filter(
+                    ResourceEndpoint.resource_id == resource_id
+                ).first()
+            finally:
+                db.close()
+            name = row.endpoint if row else self.primary.name
+            self._remember(resource_id, name)
+
+        endpoint = self._by_name.get(name)
+        if endpoint is None:
+            logger.warning(f"El endpoint {name} del recurso {resource_id} ya no está configurado")
+            return self.primary
+        return endpoint
+
+    def assign(self, resource_id: str, endpoint: Endpoint, resource_type: str) -> None:
+        """Registrar el endpoint en el que se ha creado un recurso"""
+        if not self.multi_endpoint:
+            return
+
+        db = SessionLocal()
+        try:
+            db.merge(ResourceEndpoint(
+                resource_id=resource_id,
+                resource_type=resource_type,
+                endpoint=endpoint.name
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._remember(resource_id, endpoint.name)
+
+    def forget(self, resource_ids: Iterable[str]) -> None:
+        """Eliminar el registro de recursos borrados"""
+        resource_ids = [resource_id for resource_id in resource_ids if resource_id]
+        if not self.multi_endpoint or not resource_ids:
+            return
+
+        db = SessionLocal()
+        try:
+            db.query(ResourceEndpoint).filter(
+                ResourceEndpoint.resource_id.in_(resource_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            for resource_id in resource_ids:
+                self._owners.pop(resource_id, None)
+
+    def record_start(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.in_flight += 1
+
+    def record(self, endpoint: Endpoint, latency: Optional[float], ok: bool) -> None:
+        """Actualizar las métricas EWMA con el resultado de una petición"""
+        with self._lock:
+            endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+            endpoint.requests += 1
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+
+            if ok:
+                endpoint.consecutive_failures = 0
+                if latency is not None:
+                    if endpoint.latency is None:
+                        endpoint.latency = latency
+                    else:
+                        endpoint.latency += self.alpha * (latency - endpoint.latency)
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.available():
+                    logger.warning(
+                        f"Endpoint {endpoint.name} en cuarentena {self.cooldown}s "
+                        f"tras {endpoint.consecutive_failures} errores seguidos"
+                    )
+                endpoint.cooldown_until = time.monotonic() + self.cooldown
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "primary": self.primary.name,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints]
+        }
+
+    def _remember(self, resource_id: str, name: str) -> None:
+        with self._lock:
+            self._owners[resource_id] = name
+            self._owners.move_to_end(resource_id)
+            while len(self._owners) > MAX_CACHED_OWNERS:
+                self._owners.popitem(last=False)
+
+# Enrutador de endpoints (singleton)
+_endpoint_router: Optional[EndpointRouter] = None
+_endpoint_router_lock = threading.Lock()
+
+def get_endpoint_router() -> EndpointRouter:
+    global _endpoint_router
+
+    if _endpoint_router is None:
+        with _endpoint_router_lock:
+            if _endpoint_router is None:
+                _endpoint_router = EndpointRouter(
+                    parse_endpoints(settings.AZURE_AI_ENDPOINTS, settings.AZURE_AI_ENDPOINT),
+                    alpha=settings.ROUTER_EWMA_ALPHA,
+                    failure_threshold=settings.ROUTER_FAILURE_THRESHOLD,
+                    cooldown=settings.ROUTER_COOLDOWN,
+                    retry_total=settings.ROUTER_RETRY_TOTAL
+                )
+
+    return _endpoint_router
@@ -0,0 +1,245 @@
+"""
+Eventos de conversación en tiempo real
+
+Broker en memoria (uno por proceso) que reparte los eventos de cada thread
+—cambios de estado de los runs y mensajes nuevos— entre sus suscriptores,
+como las conexiones del gateway WebSocket. Se publica desde el bucle de
+eventos y los suscriptores no deben bloquear: cada uno decide cómo aplicar la
+contrapresión si no puede aceptar más eventos.
+
+Con varios procesos (RUN_QUEUE_BACKEND=database) un run puede ejecutarse en un
+worker distinto del que tiene la conexión suscrita: el relé de eventos escribe
+cada evento publicado en la tabla thread_events y cada proceso consulta
+periódicamente los eventos de los demás para entregarlos a sus suscriptores.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ThreadEvent
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+Subscriber = Callable[[Dict[str, Any]], None]
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def run_event(thread_id: str, run: Dict[str, Any]) -> Dict[str, Any]:
+    """Evento de cambio de estado de un run (run ya serializado)"""
+    return {"type": "run", "thread_id": thread_id, "run": run}
+
+def message_event(thread_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Evento de mensaje nuevo en un thread (mensaje ya serializado)"""
+    return {"type": "message", "thread_id": thread_id, "message": message}
+
+class ThreadEventBroker:
+    """Publicación/suscripción de eventos por thread"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self.relay: Optional["DatabaseEventRelay"] = None
+        self.published = 0
+
+    def subscribe(self, thread_id: str, subscriber: Subscriber) -> None:
+        self._subscribers.setdefault(thread_id, set()).add(subscriber)
+
+    def unsubscribe(self, thread_id: str, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(thread_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[thread_id]
+
+    def publish(self, thread_id: str, event: Dict[str, Any]) -> None:
+        """Entregar un evento a los suscriptores del thread y a los demás procesos"""
+        self.published += 1
+        if self.relay is not None:
+            self.relay.forward(thread_id, event)
+        self.deliver(thread_id, event)
+
+    def deliver(self, thread_id: str, event: Dict[str, Any]) -> None:
+        """Entregar un evento solo a los suscriptores de este proceso"""
+        for subscriber in list(self._subscribers.get(thread_id, ())):
+            try:
+                subscriber(event)
+            except Exception as e:
+                logger.error(f"Error al entregar evento del thread {thread_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "threads": len(self._subscribers),
+            "subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published
+        }
+        if self.relay is not None:
+            stats["relay"] = self.relay.stats()
+        return stats
+
+class DatabaseEventRelay:
+    """Reenvío de eventos entre procesos a través de la tabla thread_events
+
+    Los eventos se escriben en orden desde una única tarea por proceso. La
+    lectura no usa un cursor por id (los ids de procesos distintos pueden
+    confirmarse desordenados): cada consulta repasa los últimos `lookback`
+    segundos y descarta los eventos ya entregados. Los relojes de los procesos
+    deben diferir menos que `lookback`.
+    """
+
+    def __init__(self, broker: ThreadEventBroker, poll_interval: float, lookback: float, retention: float):
+        self.broker = broker
+        self.origin = uuid.uuid4().hex
+        self.poll_interval = poll_interval
+        self.lookback = lookback
+        self.retention = retention
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._seen: Dict[int, float] = {}  # id -> instante (monotonic) en que se entregó
+        self._tasks: List[asyncio.Task] = []
+        self.forwarded = 0
+        self.received = 0
+
+    async def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._write()),
+            asyncio.create_task(self._poll()),
+        ]
+        logger.info(f"Relé de eventos entre procesos iniciado (origen {self.origin})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Escribir los eventos que quedaban pendientes
+        pending = []
+        while not self._outbox.empty():
+            pending.append(self._outbox.get_nowait())
+        if pending:
+            try:
+                await run_in_threadpool(self._insert, pending)
+            except Exception as e:
+                logger.error(f"Error al escribir eventos pendientes del relé: {e}")
+        logger.info("Relé de eventos entre procesos detenido")
+
+    def forward(self, thread_id: str, event: Dict[str, Any]) -> None:
+        """Encolar un evento para los demás procesos (no bloquea)"""
+        self._outbox.put_nowait((thread_id, json.dumps(event, default=str), _now()))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self._outbox.qsize(),
+            "forwarded": self.forwarded,
+            "received": self.received
+        }
+
+    def _insert(self, batch: List[Tuple[str, str, datetime]]) -> None:
+        db = SessionLocal()
+        try:
+            db.add_all([
+                ThreadEvent(thread_id=thread_id, origin=self.origin, payload=payload, created_at=created_at)
+                for thread_id, payload, created_at in batch
+            ])
+            db.commit()
+        finally:
+            db.close()
+        self.forwarded += len(batch)
+
+    def _fetch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        threshold = _now() - timedelta(seconds=self.lookback)
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(ThreadEvent.id, ThreadEvent.thread_id, ThreadEvent.payload)
+                .filter(ThreadEvent.created_at >= threshold, ThreadEvent.origin != self.origin)
+                .order_by(ThreadEvent.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        now = time.monotonic()
+        events = []
+        for event_id, thread_id, payload in rows:
+            if event_id in self._seen:
+                continue
+            self._seen[event_id] = now
+            events.append((thread_id, json.loads(payload)))
+
+        # Olvidar los eventos que ya han salido de la ventana (con margen)
+        expiry = now - 2 * self.lookback
+        self._seen = {event_id: seen_at for event_id, seen_at in self._seen.items() if seen_at >= expiry}
+        return events
+
+    def _cleanup(self) -> None:
+        db = SessionLocal()
+        try:
+            deleted = (
+                db.query(ThreadEvent)
+                .filter(ThreadEvent.created_at < _now() - timedelta(seconds=self.retention))
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            logger.debug(f"{deleted} eventos antiguos eliminados de thread_events")
+
+    async def _write(self) -> None:
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            try:
+                await run_in_threadpool(self._insert, batch)
+            except Exception as e:
+                logger.error(f"Error al escribir {len(batch)} eventos en thread_events: {e}")
+
+    async def _poll(self) -> None:
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for thread_id, event in await run_in_threadpool(self._fetch):
+                    self.received += 1
+                    self.broker.deliver(thread_id, event)
+
+                if time.monotonic() - last_cleanup >= self.retention:
+                    last_cleanup = time.monotonic()
+                    await run_in_threadpool(self._cleanup)
+            except Exception as e:
+                logger.error(f"Error al leer eventos de otros procesos: {e}")
+
+# Broker de eventos (uno por proceso)
+event_broker = ThreadEventBroker()
+
+async def start_event_relay() -> None:
+    """Iniciar el relé entre procesos (llamado desde el lifespan de la aplicación)"""
+    if settings.RUN_QUEUE_BACKEND != "database":
+        return
+
+    relay = DatabaseEventRelay(
+        event_broker,
+        poll_interval=settings.EVENT_RELAY_POLL_INTERVAL,
+        lookback=settings.EVENT_RELAY_LOOKBACK,
+        retention=settings.EVENT_RELAY_RETENTION
+    )
+    await relay.start()
+    event_broker.relay = relay
+
+async def stop_event_relay() -> None:
+    """Detener el relé entre procesos"""
+    relay = event_broker.relay
+    if relay is not None:
+        event_broker.relay = None
+        await relay.stop()
@@ -0,0 +1,249 @@
+"""
+Caché de respuestas de agentes
+
+Caché opcional por agente para preguntas repetidas. La clave es
+(agent_id, updated_at del agente, prompt normalizado), de modo que cualquier
+cambio en el agente invalida sus entradas: la API actualiza updated_at cada vez
+que modifica un agente (touch_agent) y los agentes que no están en la base de
+datos no se cachean. Solo se cachea el primer turno de cada conversación, ya
+que la respuesta a un mensaje posterior depende de los anteriores. Si la
+política define un umbral de similitud y hay modelo de embeddings configurado,
+las preguntas parecidas se resuelven con un índice vectorial local en NumPy.
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.endpoint_router import get_endpoint_router
+from app.models import Agent, AgentPolicy
+from app.observability import timed
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+def _numpy():
+    """Importar NumPy bajo demanda; la búsqueda por similitud es opcional"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalizar un prompt para comparar preguntas equivalentes"""
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip("¿?¡!.,;: ")
+
+class ResponseCache:
+    """Caché LRU con TTL e índice de embeddings por agente"""
+
+    def __init__(self, max_entries: int):
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._by_agent: Dict[Tuple[str, str], Set[CacheKey]] = {}
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, agent_id: str, version: str, prompt: str) -> Optional[str]:
+        """Buscar una respuesta por coincidencia exacta del prompt normalizado"""
+        key = (agent_id, version, normalize_prompt(prompt))
+        with self._lock:
+            return self._fresh(key, self._entries.get(key))
+
+    def get_similar(self, agent_id: str, version: str, embedding, threshold: float) -> Optional[str]:
+        """Buscar la respuesta cuyo embedding supere el umbral de similitud coseno"""
+        np = _numpy()
+        with self._lock:
+            keys = [
+                key for key in self._by_agent.get((agent_id, version), ())
+                if self._entries[key]["embedding"] is not None
+            ]
+            if not keys:
+                return self._fresh(None, None)
+
+            matrix = np.vstack([self._entries[key]["embedding"] for key in keys])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return self._fresh(None, None)
+            return self._fresh(keys[best], self._entries[keys[best]])
+
+    def put(self, agent_id: str, version: str, prompt: str, response: str, ttl: int, embedding=None) -> None:
+        key = (agent_id, version, normalize_prompt(prompt))
+        with self._lock:
+            self._entries[key] = {
+                "response": response,
+                "expires_at": time.monotonic() + ttl,
+                "embedding": embedding
+            }
+            self._entries.move_to_end(key)
+            self._by_agent.setdefault((agent_id, version), set()).add(key)
+
+            while len(self._entries) > self._max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._forget(oldest)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _fresh(self, key: Optional[CacheKey], entry: Optional[Dict[str, Any]]) -> Optional[str]:
+        # Llamar con el lock adquirido
+        if entry is not None and entry["expires_at"] <= time.monotonic():
+            del self._entries[key]
+            self._forget(key)
+            entry = None
+
+        if entry is None:
+            return None
+
+        self._entries.move_to_end(key)
+        return entry["response"]
+
+    def _forget(self, key: CacheKey) -> None:
+        keys = self._by_agent.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_agent[key[:2]]
+
+# Caché de respuestas (una por proceso)
+response_cache = ResponseCache(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+
+# Clientes OpenAI para embeddings (uno por cliente de proyecto)
+_openai_clients: Dict[Any, Any] = {}
+
+def _create_embedding(azure_client, text: str):
+    openai_client = _openai_clients.get(azure_client)
+    if openai_client is None:
+        openai_client = _openai_clients[azure_client] = azure_client.get_openai_client(
+            api_version=settings.RESPONSE_CACHE_OPENAI_API_VERSION
+        )
+
+    return openai_client.embeddings.create(
+        model=settings.RESPONSE_CACHE_EMBEDDING_MODEL,
+        input=text
+    )
+
+def embed_prompt(prompt: str):
+    """Calcular el embedding normalizado de un prompt, si está disponible"""
+    np = _numpy()
+    if np is None or not settings.RESPONSE_CACHE_EMBEDDING_MODEL:
+        return None
+
+    # Llamada sin estado: puede resolverla cualquier endpoint
+    with timed("embeddings"):
+        _, response = get_endpoint_router().call_with_failover(
+            lambda azure_client: _create_embedding(azure_client, normalize_prompt(prompt))
+        )
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def get_cache_policy(db: Session, agent_id: str) -> Optional[AgentPolicy]:
+    """Devolver la política del agente si tiene la caché activada"""
+    policy = db.query(AgentPolicy).filter(AgentPolicy.agent_id == agent_id).first()
+    return policy if policy is not None and policy.cache_enabled else None
+
+def agent_version(db: Session, agent_id: str) -> Optional[str]:
+    """Versión del agente usada en la clave de caché (su updated_at)
+
+    None si el agente no está en la base de datos: sin versión no se puede
+    saber si ha cambiado, así que sus respuestas no se cachean.
+    """
+    agent = db.query(Agent.updated_at).filter(Agent.id == agent_id).first()
+    if agent is None:
+        return None
+    return agent.updated_at.isoformat() if agent.updated_at else ""
+
+def touch_agent(agent_id: str) -> None:
+    """Marcar un agente como modificado, invalidando sus respuestas cacheadas"""
+    db = SessionLocal()
+    try:
+        db.query(Agent).filter(Agent.id == agent_id).update(
+            {"updated_at": datetime.now(timezone.utc)}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def is_first_turn(azure_client, thread_id: str) -> bool:
+    """Si el thread aún no tiene mensajes (solo esos turnos se cachean)"""
+    messages = azure_client.agents.messages.list(thread_id=thread_id, limit=1)
+    return next(iter(messages), None) is None
+
+def lookup_response(db: Session, policy: AgentPolicy, prompt: str) -> Optional[str]:
+    """Buscar una respuesta cacheada para el prompt"""
+    version = agent_version(db, policy.agent_id)
+    if version is None:
+        return None
+
+    response = response_cache.get(policy.agent_id, version, prompt)
+    if response is None and policy.cache_similarity_threshold is not None:
+        try:
+            embedding = embed_prompt(prompt)
+        except Exception as e:
+            logger.warning(f"Error al calcular embedding para la caché: {e}")
+            embedding = None
+
+        if embedding is not None:
+            response = response_cache.get_similar(
+                policy.agent_id, version, embedding, policy.cache_similarity_threshold
+            )
+
+    response_cache.record(hit=response is not None)
+    return response
+
+def store_response(agent_id: str, prompt: str, response: str) -> None:
+    """Guardar en caché la respuesta de un run (llamado desde el worker)"""
+    db = SessionLocal()
+    try:
+        policy = get_cache_policy(db, agent_id)
+        version = agent_version(db, agent_id)
+        if policy is None or version is None:
+            return
+
+        embedding = embed_prompt(prompt) if policy.cache_similarity_threshold is not None else None
+        response_cache.put(
+            agent_id,
+            version,
+            prompt,
+            response,
+            ttl=policy.cache_ttl_seconds or 0,
+            embedding=embedding
+        )
+    finally:
+        db.close()
+
+def append_cached_turn(azure_client, thread_id: str, prompt: str, response: str) -> None:
+    """Registrar en el thread la pregunta y la respuesta servidas desde caché"""
+    try:
+        azure_client.agents.messages.create(thread_id=thread_id, role="user", content=prompt)
+        azure_client.agents.messages.create(thread_id=thread_id, role="assistant", content=response)
+    except Exception as e:
+        logger.error(f"Error al registrar turno cacheado en thread {thread_id}: {e}")
@@ -0,0 +1,641 @@
+"""
+Cola de runs en segundo plano
+
+Desacopla la recepción de mensajes de la ejecución de los runs en Azure Foundry:
+los endpoints encolan un job y un pool acotado de workers lo procesa. Un job
+solo se reclama si su thread no tiene otro run en curso (Foundry rechaza dos
+runs activos en el mismo thread) y su agente no ha alcanzado el límite de runs
+concurrentes; el resto espera en la cola.
+
+Si tras el run el thread supera la ventana de contexto del agente, el job se
+publica con su respuesta en estado compacting y el thread sigue ocupado hasta
+que termina el resumen; entonces pasa a completed con next_thread_id.
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.endpoint_router import get_endpoint_router
+from app.models import RunJob
+from app.services.context_window import compact_thread, message_text, needs_compaction
+from app.services.events import event_broker, run_event
+from app.services.response_cache import store_response
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("completed", "failed")
+# Estados que ocupan el thread y un hueco de concurrencia del agente
+ACTIVE_STATUSES = ("in_progress", "compacting")
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def new_job(
+    thread_id: str,
+    agent_id: str,
+    message_id: Optional[str] = None,
+    prompt: Optional[str] = None
+) -> Dict[str, Any]:
+    """Crear la representación de un job pendiente"""
+    return {
+        "id": f"job_{uuid.uuid4().hex}",
+        "thread_id": thread_id,
+        "agent_id": agent_id,
+        "message_id": message_id,
+        "prompt": prompt,
+        "status": "queued",
+        "run_id": None,
+        "next_thread_id": None,
+        "last_error": None,
+        "result": None,
+        "created_at": _now(),
+        "started_at": None,
+        "heartbeat_at": None,
+        "completed_at": None
+    }
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte un job a diccionario para respuesta JSON"""
+    response = dict(job)
+    response.pop("prompt", None)
+    response.pop("heartbeat_at", None)
+    for field in ("created_at", "started_at", "completed_at"):
+        response[field] = job[field].isoformat() if job.get(field) else None
+    return response
+
+def serialize_message(message) -> Dict[str, Any]:
+    """Convierte un mensaje de Azure Foundry a diccionario serializable"""
+    return {
+        "id": message.id,
+        "thread_id": message.thread_id,
+        "role": message.role,
+        "content": message_text(message),
+        "created_at": message.created_at.isoformat() if message.created_at else None
+    }
+
+class RunQueueBackend:
+    """Interfaz común de los backends de la cola de runs"""
+    
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+    
+    async def dequeue(self) -> Dict[str, Any]:
+        """Esperar y reclamar el siguiente job que pueda ejecutarse"""
+        raise NotImplementedError
+    
+    async def update(self, job_id: str, **fields: Any) -> None:
+        raise NotImplementedError
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+    
+    async def thread_busy(self, thread_id: str) -> bool:
+        """Si el thread tiene algún job pendiente o en curso"""
+        raise NotImplementedError
+    
+    async def heartbeat(self, job_ids: List[str]) -> None:
+        """Renovar la reserva de los jobs en curso en este proceso"""
+    
+    async def requeue(self, job: Dict[str, Any]) -> None:
+        """Devolver a la cola un job reclamado que no llegó a completarse"""
+        await self.update(job["id"], status="queued", started_at=None, heartbeat_at=None)
+
+class InMemoryRunQueue(RunQueueBackend):
+    """Backend en memoria (un solo proceso)"""
+    
+    def __init__(self, max_finished: int, max_per_agent: int):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._max_finished = max_finished
+        self._max_per_agent = max_per_agent
+        self._wakeup = asyncio.Event()
+        
+        # Jobs en curso por agente y por thread; jobs sin terminar por thread
+        self._running_by_agent: Dict[str, int] = defaultdict(int)
+        self._running_threads: Set[str] = set()
+        self._open_by_thread: Dict[str, int] = defaultdict(int)
+    
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+        self._open_by_thread[job["thread_id"]] += 1
+        self._pending[job["id"]] = None
+        self._wakeup.set()
+    
+    async def dequeue(self) -> Dict[str, Any]:
+        while True:
+            for job_id in self._pending:
+                job = self._jobs[job_id]
+                if self._runnable(job):
+                    del self._pending[job_id]
+                    self._claim(job)
+                    return job
+            
+            self._wakeup.clear()
+            await self._wakeup.wait()
+    
+    async def update(self, job_id: str, **fields: Any) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        previous = job["status"]
+        job.update(fields)
+        status = job["status"]
+        
+        if previous in ACTIVE_STATUSES and status not in ACTIVE_STATUSES:
+            self._release(job)
+        
+        if status == "queued" and previous != "queued":
+            self._pending[job_id] = None
+            self._wakeup.set()
+        
+        # Conservar solo los últimos jobs finalizados para acotar la memoria
+        if status in FINISHED_STATUSES and previous not in FINISHED_STATUSES:
+            self._open_by_thread[job["thread_id"]] -= 1
+            if not self._open_by_thread[job["thread_id"]]:
+                del self._open_by_thread[job["thread_id"]]
+            
+            self._finished[job_id] = None
+            while len(self._finished) > self._max_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+    
+    async def thread_busy(self, thread_id: str) -> bool:
+        return thread_id in self._open_by_thread
+    
+    def _runnable(self, job: Dict[str, Any]) -> bool:
+        return (
+            job["thread_id"] not in self._running_threads
+            and self._running_by_agent[job["agent_id"]] < self._max_per_agent
+        )
+    
+    def _claim(self, job: Dict[str, Any]) -> None:
+        job.update(status="in_progress", started_at=_now())
+        self._running_threads.add(job["thread_id"])
+        self._running_by_agent[job["agent_id"]] += 1
+    
+    def _release(self, job: Dict[str, Any]) -> None:
+        self._running_threads.discard(job["thread_id"])
+        self._running_by_agent[job["agent_id"]] -= 1
+        if not self._running_by_agent[job["agent_id"]]:
+            del self._running_by_agent[job["agent_id"]]
+        
+        # Un hueco libre puede desbloquear jobs del mismo thread o agente
+        self._wakeup.set()
+
+class DatabaseRunQueue(RunQueueBackend):
+    """Backend persistente sobre la tabla run_jobs"""
+    
+    def __init__(self, poll_interval: float, max_per_agent: int, visibility_timeout: float):
+        self._poll_interval = poll_interval
+        self._max_per_agent = max_per_agent
+        self._visibility_timeout = visibility_timeout
+        self._poll_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+    
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        await run_in_threadpool(self._insert, job)
+        self._wakeup.set()
+    
+    async def dequeue(self) -> Dict[str, Any]:
+        # Un solo worker consulta la BD a la vez; el resto espera su turno
+        async with self._poll_lock:
+            while True:
+                job = await run_in_threadpool(self._claim_next)
+                if job is not None:
+                    return job
+                
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def update(self, job_id: str, **fields: Any) -> None:
+        await run_in_threadpool(self._update, job_id, fields)
+        # Un job devuelto a la cola o terminado puede desbloquear otros
+        if fields.get("status") == "queued" or fields.get("status") in FINISHED_STATUSES:
+            self._wakeup.set()
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self._get, job_id)
+    
+    async def thread_busy(self, thread_id: str) -> bool:
+        return await run_in_threadpool(self._thread_busy, thread_id)
+    
+    async def heartbeat(self, job_ids: List[str]) -> None:
+        if job_ids:
+            await run_in_threadpool(self._heartbeat, job_ids)
+    
+    @staticmethod
+    def _to_dict(record: RunJob) -> Dict[str, Any]:
+        return {
+            "id": record.id,
+            "thread_id": record.thread_id,
+            "agent_id": record.agent_id,
+            "message_id": record.message_id,
+            "prompt": record.prompt,
+            "status": record.status,
+            "run_id": record.run_id,
+            "next_thread_id": record.next_thread_id,
+            "last_error": record.last_error,
+            "result": record.result,
+            "created_at": record.created_at,
+            "started_at": record.started_at,
+            "heartbeat_at": record.heartbeat_at,
+            "completed_at": record.completed_at
+        }
+    
+    def _insert(self, job: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            db.add(RunJob(**job))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _reclaim_stale(self, db) -> None:
+        """Devolver a la cola los jobs en curso cuya reserva ha caducado"""
+        threshold = _now() - timedelta(seconds=self._visibility_timeout)
+        reclaimed = (
+            db.query(RunJob)
+            .filter(
+                RunJob.status == "in_progress",
+                func.coalesce(RunJob.heartbeat_at, RunJob.started_at) < threshold
+            )
+            .update({"status": "queued", "started_at": None, "heartbeat_at": None}, synchronize_session=False)
+        )
+        # Los que ya tenían respuesta se dan por completados sin resumir el thread
+        abandoned = (
+            db.query(RunJob)
+            .filter(
+                RunJob.status == "compacting",
+                func.coalesce(RunJob.heartbeat_at, RunJob.started_at) < threshold
+            )
+            .update({"status": "completed"}, synchronize_session=False)
+        )
+        db.commit()
+        if reclaimed:
+            logger.warning(f"{reclaimed} jobs sin heartbeat devueltos a la cola")
+        if abandoned:
+            logger.warning(f"{abandoned} jobs sin heartbeat dados por completados sin resumir su thread")
+    
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            self._reclaim_stale(db)
+            
+            # Solo jobs cuyo thread no tiene un run en curso y cuyo agente no
+            # está al límite; SKIP LOCKED evita que varios procesos reclamen
+            # el mismo job
+            running = select(RunJob.thread_id).where(RunJob.status.in_(ACTIVE_STATUSES))
+            full_agents = (
+                select(RunJob.agent_id)
+                .where(RunJob.status.in_(ACTIVE_STATUSES))
+                .group_by(RunJob.agent_id)
+                .having(func.count() >= self._max_per_agent)
+            )
+            record = (
+                db.query(RunJob)
+                .filter(
+                    RunJob.status == "queued",
+                    RunJob.thread_id.not_in(running),
+                    RunJob.agent_id.not_in(full_agents)
+                )
+                .order_by(RunJob.created_at)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if record is None:
+                db.rollback()
+                return None
+            
+            record.status = "in_progress"
+            record.started_at = record.heartbeat_at = _now()
+            job = self._to_dict(record)
+            db.commit()
+            return job
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(RunJob).filter(RunJob.id == job_id).update(fields)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            record = db.query(RunJob).filter(RunJob.id == job_id).first()
+            return self._to_dict(record) if record else None
+        finally:
+            db.close()
+    
+    def _thread_busy(self, thread_id: str) -> bool:
+        db = SessionLocal()
+        try:
+            return db.query(
+                db.query(RunJob)
+                .filter(RunJob.thread_id == thread_id, RunJob.status.in_(("queued",) + ACTIVE_STATUSES))
+                .exists()
+            ).scalar()
+        finally:
+            db.close()
+    
+    def _heartbeat(self, job_ids: List[str]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(RunJob).filter(
+                RunJob.id.in_(job_ids), RunJob.status.in_(ACTIVE_STATUSES)
+            ).update({"heartbeat_at": _now()}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+def execute_run(thread_id: str, agent_id: str) -> Dict[str, Any]:
+    """Ejecutar un run en Azure Foundry y recoger los mensajes que genera"""
+    from azure.ai.agents.models import ListSortOrder
+    
+    azure_client = get_endpoint_router().client_for(thread_id)
+    
+    run = azure_client.agents.runs.create_and_process(
+        thread_id=thread_id,
+        agent_id=agent_id
+    )
+    
+    if run.status != "completed":
+        return {
+            "status": "failed",
+            "run_id": run.id,
+            "last_error": str(run.last_error) if run.last_error else f"Run terminó con estado {run.status}"
+        }
+    
+    messages = azure_client.agents.messages.list(
+        thread_id=thread_id,
+        run_id=run.id,
+        order=ListSortOrder.ASCENDING
+    )
+    
+    return {
+        "status": "completed",
+        "run_id": run.id,
+        "result": [serialize_message(message) for message in messages],
+        "prompt_tokens": run.usage.prompt_tokens if run.usage else None
+    }
+
+class RunWorkerPool:
+    """Pool acotado de workers que procesa los jobs de la cola"""
+    
+    def __init__(self, backend: RunQueueBackend, workers: int, heartbeat_interval: float, retry_interval: float):
+        self.backend = backend
+        self._workers = workers
+        self._heartbeat_interval = heartbeat_interval
+        self._retry_interval = retry_interval
+        self._tasks: List[asyncio.Task] = []
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._current: Dict[asyncio.Task, Dict[str, Any]] = {}
+        self._stopping = False
+    
+    async def start(self) -> None:
+        for index in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"Pool de runs iniciado con {self._workers} workers")
+    
+    async def stop(self, drain_timeout: float = 0) -> None:
+        """Detener los workers esperando hasta drain_timeout a los runs en curso"""
+        self._stopping = True
+        
+        # Los workers ociosos se cancelan; los ocupados terminan su run actual
+        for task in self._tasks:
+            if task not in self._current:
+                task.cancel()
+        
+        if self._current and drain_timeout > 0:
+            logger.info(f"Esperando a {len(self._current)} runs en curso (máx. {drain_timeout}s)")
+            await asyncio.wait(set(self._current), timeout=drain_timeout)
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        
+        # Los runs interrumpidos vuelven a la cola para otro proceso; los que
+        # ya tenían respuesta se dan por completados sin resumir el thread
+        for job in self._current.values():
+            try:
+                if job["status"] == "compacting":
+                    logger.warning(f"Resumen del thread {job['thread_id']} interrumpido")
+                    await self.backend.update(job["id"], status="completed")
+                else:
+                    logger.warning(f"Job {job['id']} interrumpido, se devuelve a la cola")
+                    await self.backend.requeue(job)
+            except Exception as e:
+                logger.error(f"Error al liberar el job interrumpido {job['id']}: {e}")
+        self._current.clear()
+        logger.info("Pool de runs detenido")
+    
+    async def submit(
+        self,
+        thread_id: str,
+        agent_id: str,
+        message_id: Optional[str] = None,
+        prompt: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Encolar un nuevo run; prompt se indica si su respuesta debe cachearse"""
+        job = new_job(thread_id, agent_id, message_id, prompt)
+        await self.backend.enqueue(job)
+        return job
+    
+    async def _worker(self, index: int) -> None:
+        task = asyncio.current_task()
+        while not self._stopping:
+            # Un error de la cola (p. ej. la BD caída) no debe terminar el worker
+            try:
+                job = await self.backend.dequeue()
+            except Exception as e:
+                logger.error(f"Error al reclamar job en el worker {index}: {e}")
+                await asyncio.sleep(self._retry_interval)
+                continue
+            
+            self._current[task] = job
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Error al guardar el resultado del job {job['id']}: {e}")
+                await self._abandon(job, e)
+                await asyncio.sleep(self._retry_interval)
+            # Si el worker se cancela a mitad, stop() devuelve el job a la cola
+            del self._current[task]
+    
+    async def _heartbeat(self) -> None:
+        """Renovar periódicamente la reserva de los jobs en curso"""
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            try:
+                await self.backend.heartbeat([job["id"] for job in self._current.values()])
+            except Exception as e:
+                logger.error(f"Error al renovar el heartbeat de los jobs: {e}")
+    
+    async def _process(self, job: Dict[str, Any]) -> None:
+        # El backend ya marcó el job como in_progress al reclamarlo
+        self._publish(job)
+        try:
+            outcome = await run_in_threadpool(execute_run, job["thread_id"], job["agent_id"])
+        except Exception as e:
+            logger.error(f"Error al procesar job {job['id']}: {e}")
+            outcome = {"status": "failed", "last_error": str(e)}
+        
+        if outcome["status"] == "failed":
+            logger.warning(f"Run fallido para job {job['id']}: {outcome['last_error']}")
+        
+        # Si el thread supera la ventana de contexto del agente se resume
+        # después de entregar la respuesta
+        prompt_tokens = outcome.pop("prompt_tokens", None)
+        compacting = False
+        if outcome["status"] == "completed":
+            try:
+                compacting = await run_in_threadpool(
+                    needs_compaction, job["thread_id"], job["agent_id"], prompt_tokens
+                )
+            except Exception as e:
+                logger.error(f"Error al comprobar la ventana de contexto del thread {job['thread_id']}: {e}")
+        
+        # Guardar la respuesta en la caché del agente
+        if outcome["status"] == "completed" and job.get("prompt"):
+            reply = "\n".join(
+                message["content"] for message in outcome["result"] if message["role"] == "assistant"
+            )
+            if reply:
+                try:
+                    await run_in_threadpool(store_response, job["agent_id"], job["prompt"], reply)
+                except Exception as e:
+                    logger.error(f"Error al guardar respuesta en caché para job {job['id']}: {e}")
+        
+        outcome["completed_at"] = _now()
+        if compacting:
+            outcome["status"] = "compacting"
+        await self.backend.update(job["id"], **outcome)
+        job.update(outcome)
+        self._publish(job)
+        
+        if compacting:
+            await self._compact(job)
+    
+    async def _compact(self, job: Dict[str, Any]) -> None:
+        """Resumir el thread de un job ya respondido y liberarlo"""
+        next_thread_id = None
+        try:
+            next_thread_id = await run_in_threadpool(compact_thread, job["thread_id"], job["agent_id"])
+        except Exception as e:
+            logger.error(f"Error al resumir thread {job['thread_id']}: {e}")
+        
+        await self.backend.update(job["id"], status="completed", next_thread_id=next_thread_id)
+        job.update(status="completed", next_thread_id=next_thread_id)
+        self._publish(job)
+    
+    async def _abandon(self, job: Dict[str, Any], error: Exception) -> None:
+        """Marcar como fallido un job cuyo resultado no pudo guardarse, o devolverlo a la cola"""
+        failed = {"status": "failed", "last_error": f"Error al guardar el resultado: {error}", "completed_at": _now()}
+        # Un job con la respuesta ya entregada solo estaba resumiendo el thread
+        answered = job["status"] == "compacting"
+        if answered:
+            failed = {"status": "completed"}
+        try:
+            await self.backend.update(job["id"], **failed)
+        except Exception as e:
+            logger.error(f"Error al marcar como terminado el job {job['id']}: {e}")
+        else:
+            self._publish({**job, **failed})
+            return
+        
+        # Repetir un run ya respondido duplicaría el turno; la cola persistente
+        # lo da por completado al caducar su reserva
+        if answered:
+            return
+        try:
+            await self.backend.requeue(job)
+        except Exception as e:
+            # Sin heartbeat, la cola persistente lo reclamará al caducar su reserva
+            logger.error(f"Error al devolver a la cola el job {job['id']}: {e}")
+    
+    @staticmethod
+    def _publish(job: Dict[str, Any]) -> None:
+        """Notificar el estado del job a los suscriptores de su thread"""
+        event_broker.publish(job["thread_id"], run_event(job["thread_id"], serialize_job(job)))
+
+# Pool de workers (singleton)
+_run_worker_pool: Optional[RunWorkerPool] = None
+
+def create_backend() -> RunQueueBackend:
+    """Crear el backend de cola configurado"""
+    if settings.RUN_QUEUE_BACKEND == "memory":
+        return InMemoryRunQueue(
+            max_finished=settings.RUN_QUEUE_MAX_FINISHED,
+            max_per_agent=settings.RUN_MAX_CONCURRENCY_PER_AGENT
+        )
+    if settings.RUN_QUEUE_BACKEND == "database":
+        return DatabaseRunQueue(
+            poll_interval=settings.RUN_QUEUE_POLL_INTERVAL,
+            max_per_agent=settings.RUN_MAX_CONCURRENCY_PER_AGENT,
+            visibility_timeout=settings.RUN_JOB_VISIBILITY_TIMEOUT
+        )
+    raise ValueError(f"RUN_QUEUE_BACKEND desconocido: {settings.RUN_QUEUE_BACKEND}")
+
+async def start_run_workers() -> None:
+    """Iniciar el pool de workers (llamado desde el lifespan de la aplicación)"""
+    global _run_worker_pool
+    
+    _run_worker_pool = RunWorkerPool(
+        backend=create_backend(),
+        workers=settings.RUN_WORKERS,
+        # Varios heartbeats por periodo de visibilidad
+        heartbeat_interval=settings.RUN_JOB_VISIBILITY_TIMEOUT / 4,
+        retry_interval=settings.RUN_QUEUE_POLL_INTERVAL
+    )
+    await _run_worker_pool.start()
+
+async def stop_run_workers() -> None:
+    """Detener el pool de workers"""
+    global _run_worker_pool
+    
+    if _run_worker_pool is not None:
+        await _run_worker_pool.stop(drain_timeout=settings.RUN_DRAIN_TIMEOUT)
+        _run_worker_pool = None
+
+def get_run_worker_pool() -> RunWorkerPool:
+    if _run_worker_pool is None:
+        raise RuntimeError("El pool de workers de runs no está iniciado")
+    return _run_worker_pool
@@ -0,0 +1,177 @@
+"""
+Pool de threads precreados
+
+Mantiene en segundo plano una reserva de threads vacíos en Azure Foundry para
+que iniciar una conversación no tenga que esperar a la creación del thread.
+Hay una reserva por endpoint (los threads deben vivir junto al agente) que se
+repone de forma asíncrona hasta el tamaño objetivo; los threads que llevan
+demasiado tiempo sin usarse se eliminan.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.services.endpoint_router import Endpoint, get_endpoint_router
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def _create_thread(endpoint: Endpoint) -> str:
+    endpoint_router = get_endpoint_router()
+    thread_id = endpoint_router.client(endpoint).agents.threads.create().id
+    endpoint_router.assign(thread_id, endpoint, "thread")
+    return thread_id
+
+def _delete_threads(endpoint: Endpoint, thread_ids: List[str]) -> None:
+    endpoint_router = get_endpoint_router()
+    azure_client = endpoint_router.client(endpoint)
+    for thread_id in thread_ids:
+        try:
+            azure_client.agents.threads.delete(thread_id=thread_id)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar thread {thread_id} del pool: {e}")
+
+    try:
+        endpoint_router.forget(thread_ids)
+    except Exception as e:
+        logger.warning(f"No se pudo eliminar el registro de threads del pool: {e}")
+
+class ThreadPool:
+    """Reserva de threads vacíos repuesta en segundo plano"""
+
+    def __init__(self, endpoint: Endpoint, target_size: int, max_idle: float, refill_interval: float):
+        self.endpoint = endpoint
+        self.target_size = target_size
+        self.max_idle = max_idle
+        self.refill_interval = refill_interval
+        self._threads: Deque[Tuple[str, float]] = deque()  # (thread_id, creado en)
+        self._refill = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._cleanup_tasks: Set[asyncio.Task] = set()
+        self.claimed = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._maintain())
+        logger.info(f"Pool de threads de {self.endpoint.name} iniciado (tamaño objetivo {self.target_size})")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # Los threads sin usar no sobreviven al proceso
+        pending = [thread_id for thread_id, _ in self._threads]
+        self._threads.clear()
+        if pending:
+            await run_in_threadpool(_delete_threads, self.endpoint, pending)
+        logger.info(f"Pool de threads de {self.endpoint.name} detenido")
+
+    def claim(self) -> Optional[str]:
+        """Tomar un thread del pool (None si está vacío)"""
+        self._expire()
+        self._refill.set()
+
+        if not self._threads:
+            self.misses += 1
+            return None
+
+        thread_id, _ = self._threads.popleft()
+        self.claimed += 1
+        return thread_id
+
+    def discard(self, thread_id: str) -> None:
+        """Eliminar en segundo plano un thread reclamado que no llegó a usarse"""
+        self._delete_later([thread_id])
+
+    def stats(self) -> dict:
+        return {
+            "available": len(self._threads),
+            "target_size": self.target_size,
+            "claimed": self.claimed,
+            "misses": self.misses
+        }
+
+    def _expire(self) -> None:
+        expired = []
+        deadline = time.monotonic() - self.max_idle
+        while self._threads and self._threads[0][1] < deadline:
+            expired.append(self._threads.popleft()[0])
+
+        if expired:
+            self._delete_later(expired)
+
+    def _delete_later(self, thread_ids: List[str]) -> None:
+        task = asyncio.create_task(run_in_threadpool(_delete_threads, self.endpoint, thread_ids))
+        self._cleanup_tasks.add(task)
+        task.add_done_callback(self._cleanup_tasks.discard)
+
+    async def _maintain(self) -> None:
+        while True:
+            self._expire()
+            missing = self.target_size - len(self._threads)
+
+            if missing > 0:
+                results = await asyncio.gather(
+                    *[run_in_threadpool(_create_thread, self.endpoint) for _ in range(missing)],
+                    return_exceptions=True
+                )
+                now = time.monotonic()
+                failures = 0
+                for result in results:
+                    if isinstance(result, Exception):
+                        failures += 1
+                        logger.warning(f"Error al crear thread para el pool de {self.endpoint.name}: {result}")
+                    else:
+                        self._threads.append((result, now))
+
+                # Ante errores se espera el intervalo completo antes de reintentar
+                if failures:
+                    await asyncio.sleep(self.refill_interval)
+                    continue
+
+            self._refill.clear()
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+# Pools de threads (uno por endpoint)
+_thread_pools: Dict[str, ThreadPool] = {}
+
+async def start_thread_pool() -> None:
+    """Iniciar los pools de threads (llamado desde el lifespan de la aplicación)"""
+    if settings.THREAD_POOL_SIZE <= 0:
+        return
+
+    for endpoint in get_endpoint_router().endpoints:
+        thread_pool = ThreadPool(
+            endpoint=endpoint,
+            target_size=settings.THREAD_POOL_SIZE,
+            max_idle=settings.THREAD_POOL_MAX_IDLE,
+            refill_interval=settings.THREAD_POOL_REFILL_INTERVAL
+        )
+        await thread_pool.start()
+        _thread_pools[endpoint.name] = thread_pool
+
+async def stop_thread_pool() -> None:
+    """Detener los pools de threads"""
+    thread_pools = list(_thread_pools.values())
+    _thread_pools.clear()
+    await asyncio.gather(*[thread_pool.stop() for thread_pool in thread_pools])
+
+def get_thread_pool(endpoint_name: str) -> Optional[ThreadPool]:
+    """Pool de threads de un endpoint, o None si está desactivado"""
+    return _thread_pools.get(endpoint_name)
+
+def thread_pool_stats() -> Optional[Dict[str, dict]]:
+    """Estado de los pools de threads por endpoint"""
+    if not _thread_pools:
+        return None
+    return {name: thread_pool.stats() for name, thread_pool in _thread_pools.items()}
@@ -0,0 +1,120 @@
+"""
+Perfilado del arranque en frío
+
+Registra la duración de cada fase del arranque (imports de routers, lifespan,
+precalentamiento) y, con STARTUP_PROFILE activo, el coste de import de cada
+módulo cargado durante el arranque, para detectar regresiones.
+"""
+import builtins
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class StartupProfiler:
+    """Temporizador de fases y de imports del arranque"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.ready_at = None
+        self.phases: List[Dict[str, Any]] = []
+        self.imports: Dict[str, Dict[str, float]] = {}
+        self._original_import = None
+        self._local = threading.local()
+
+    def install(self) -> None:
+        """Empezar a medir los imports (llamar antes de importar los routers)"""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Medir la duración de una fase del arranque"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                "phase": name,
+                "ms": round((time.perf_counter() - start) * 1000, 2)
+            })
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+
+    def report(self, top: int = 25) -> Dict[str, Any]:
+        slowest = sorted(self.imports.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)
+        return {
+            "ready_ms": round((self.ready_at - self.started_at) * 1000, 2) if self.ready_at else None,
+            "phases": self.phases,
+            "imports": [{"module": name, **timing} for name, timing in slowest[:top]]
+        }
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Solo se miden los imports absolutos de módulos aún no cargados
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        start = time.perf_counter()
+        stack.append(0.0)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.imports[name] = {
+                "cumulative_ms": round(elapsed * 1000, 2),
+                "self_ms": round((elapsed - children) * 1000, 2)
+            }
+
+# Perfilador del arranque (uno por proceso)
+startup_profiler = StartupProfiler()
+
+def warm_up() -> None:
+    """Cargar el SDK de Azure y abrir la conexión a BD antes del primer request"""
+    from app.database import get_engine
+    from app.services.endpoint_router import get_endpoint_router
+
+    with startup_profiler.phase("warmup_database"):
+        try:
+            with get_engine().connect():
+                pass
+        except Exception as e:
+            logger.warning(f"Precalentamiento de base de datos fallido: {e}")
+
+    with startup_profiler.phase("warmup_azure_client"):
+        try:
+            endpoint_router = get_endpoint_router()
+            for endpoint in endpoint_router.endpoints:
+                endpoint_router.client(endpoint)
+            import azure.ai.agents.models  # noqa: F401
+        except Exception as e:
+            logger.warning(f"Precalentamiento del cliente de Azure AI fallido: {e}")
+
+async def complete_startup(warmup: bool) -> None:
+    """Precalentar dependencias (opcional) y emitir el informe de arranque"""
+    from starlette.concurrency import run_in_threadpool
+
+    if warmup:
+        with startup_profiler.phase("warmup"):
+            await run_in_threadpool(warm_up)
+
+    startup_profiler.uninstall()
+    logger.info(f"Informe de arranque: {startup_profiler.report()}")
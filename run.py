@@ -1,21 +1,19 @@
 """
-Script de inicio para el servidor FastAPI
+Script de inicio para el servidor FastAPI (desarrollo)
 Uso: python run.py
+
+Para producción con varios workers usar: python serve.py
 """
 import uvicorn
-import os
-from dotenv import load_dotenv
-
-# Cargar variables de entorno
-load_dotenv()
+from app.config import settings
 
 if __name__ == "__main__":
     # Configuración del servidor
     uvicorn.run(
         "app.main:app",
-        host="127.0.0.1",
-        port=8000,
+        host=settings.HOST,
+        port=settings.PORT,
         reload=True,  # Auto-reload en desarrollo
-        log_level="info",
+        log_level=settings.LOG_LEVEL,
         access_log=True
     )
@@ -0,0 +1,118 @@
+"""
+Script de inicio para producción con varios workers
+Uso: python serve.py
+
+Lanza WORKERS procesos uvicorn (uvloop + httptools) gestionados por gunicorn,
+con reciclado de workers tras MAX_REQUESTS peticiones y parada ordenada que
+espera a los runs en curso. En plataformas sin gunicorn (Windows) se usa el
+supervisor multiproceso de uvicorn.
+
+Parada: tras SIGTERM, uvicorn espera a las conexiones abiertas (SSE,
+WebSocket) y después ejecuta el lifespan, que drena los runs durante
+RUN_DRAIN_TIMEOUT. Ambas esperas deben caber en GRACEFUL_TIMEOUT, tras el
+cual gunicorn mata el worker.
+"""
+import logging
+from app.config import settings
+from app.observability import configure_logging
+
+logger = logging.getLogger("serve")
+
+# Segundos reservados para el resto de la parada (pools, conexiones a BD)
+SHUTDOWN_MARGIN = 2
+
+def worker_count() -> int:
+    """Workers a lanzar; la cola en memoria solo funciona con un proceso"""
+    if settings.WORKERS > 1 and settings.RUN_QUEUE_BACKEND == "memory":
+        # Los runs encolados en un worker no se verían desde los demás y se
+        # perderían al reciclarlo
+        logger.warning(
+            f"RUN_QUEUE_BACKEND=memory es local a cada proceso: se lanza 1 worker "
+            f"en lugar de {settings.WORKERS} (usar RUN_QUEUE_BACKEND=database para varios)"
+        )
+        return 1
+    return settings.WORKERS
+
+def connection_timeout() -> int:
+    """Espera a las conexiones abiertas que deja tiempo al drenaje de runs"""
+    timeout = int(settings.GRACEFUL_TIMEOUT - settings.RUN_DRAIN_TIMEOUT - SHUTDOWN_MARGIN)
+    if timeout < 1:
+        raise SystemExit(
+            f"GRACEFUL_TIMEOUT ({settings.GRACEFUL_TIMEOUT}s) debe superar RUN_DRAIN_TIMEOUT "
+            f"({settings.RUN_DRAIN_TIMEOUT}s) en al menos {SHUTDOWN_MARGIN + 1} segundos"
+        )
+    return timeout
+
+def gunicorn_options(workers: int) -> dict:
+    """Opciones de gunicorn derivadas de Settings"""
+    return {
+        "bind": f"{settings.HOST}:{settings.PORT}",
+        "workers": workers,
+        "max_requests": settings.MAX_REQUESTS,
+        "max_requests_jitter": settings.MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.GRACEFUL_TIMEOUT,
+        "keepalive": settings.KEEP_ALIVE,
+        "loglevel": settings.LOG_LEVEL,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+def run_with_gunicorn(workers: int, graceful_shutdown: int):
+    from gunicorn.app.base import BaseApplication
+    from uvicorn_worker import UvicornWorker
+
+    class ProductionUvicornWorker(UvicornWorker):
+        """Worker uvicorn con bucle uvloop y parser httptools"""
+        CONFIG_KWARGS = {
+            "loop": "uvloop",
+            "http": "httptools",
+            "timeout_graceful_shutdown": graceful_shutdown,
+        }
+
+    class FoundryApplication(BaseApplication):
+        """Aplicación gunicorn configurada desde Settings"""
+
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            self.cfg.set("worker_class", ProductionUvicornWorker)
+
+        def load(self):
+            from app.main import app
+            return app
+
+    FoundryApplication(gunicorn_options(workers)).run()
+
+def run_with_uvicorn(workers: int, graceful_shutdown: int):
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        limit_max_requests=settings.MAX_REQUESTS or None,
+        timeout_graceful_shutdown=graceful_shutdown,
+        timeout_keep_alive=settings.KEEP_ALIVE,
+        log_level=settings.LOG_LEVEL,
+        access_log=True
+    )
+
+if __name__ == "__main__":
+    configure_logging()
+    graceful_shutdown = connection_timeout()
+    workers = worker_count()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        logger.info("gunicorn no disponible, usando el supervisor multiproceso de uvicorn")
+        run_with_uvicorn(workers, graceful_shutdown)
+    else:
+        run_with_gunicorn(workers, graceful_shutdown)